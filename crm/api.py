@@ -1,223 +1,194 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from typing import Dict, List, Optional, Union
 from .crm import CRM
 from .models import LeadCreate, LeadUpdate, Lead
+import asyncio
+import hashlib
+import json
+import logging
 import os
 
-def create_app():
-    app = FastAPI(title="CRM API", description="REST API for CRM operations")
+async def get_crm(request: Request) -> CRM:
+    """Return the CRM shared by every request to the app."""
+    # async so FastAPI resolves it on the event loop instead of a threadpool hop
+    return request.app.state.crm
+
+def _etag(row: Dict) -> str:
+    """Return a strong ETag for a stored row."""
+    digest = hashlib.blake2b(json.dumps(row, sort_keys=True).encode(), digest_size=8).hexdigest()
+    return f'"{digest}"'
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """Return whether the client's If-None-Match already names this ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _default_db_path() -> str:
+    """Return DATABASE_URL, or crm.db next to this package when it is unset."""
     db_path = os.environ.get("DATABASE_URL")
     if not db_path:
         base_dir = os.path.dirname(os.path.abspath(__file__))
         db_path = os.path.join(base_dir, "crm.db")
-    crm = CRM(db_path)
-
+    return db_path
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # A CRM opened by create_app_with_db belongs to its caller, who closes it
+    if getattr(app.state, "crm", None) is not None:
+        yield
+        return
+    # Open the database on startup rather than at import, so every uvicorn
+    # worker opens its own connection after it has been forked
+    app.state.crm = CRM(app.state.db_path or _default_db_path())
+    try:
+        yield
+    finally:
+        # Reset so the next startup opens a fresh CRM
+        app.state.crm.close()
+        app.state.crm = None
+
+def _register_routes(app: FastAPI):
     # Lead endpoints
+    # Read endpoints are async and run the blocking SQLite call in a worker
+    # thread; write endpoints stay sync and use FastAPI's threadpool
     @app.post("/leads/", response_model=Lead)
-    def create_lead(lead_data: LeadCreate):
-        # Check for duplicate email
-        existing_leads = crm.search_leads({"email": lead_data.email.lower()})
-        if existing_leads:
-            raise HTTPException(status_code=400, detail="A lead with this email already exists")
-        
+    def create_lead(lead_data: LeadCreate, crm: CRM = Depends(get_crm)):
+        # Duplicate emails are rejected by the unique index on insert
         try:
-            lead_id = crm.create_lead(lead_data.model_dump())
-            return {**lead_data.model_dump(), "id": lead_id}
+            lead = crm.create_lead(lead_data.model_dump())
+            return Lead.model_construct(**lead)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-    @app.get("/leads/{lead_id}", response_model=Lead)
-    def get_lead(lead_id: int):
-        lead = crm.get_lead(lead_id)
-        if lead is None:
-            raise HTTPException(status_code=404, detail="Lead not found")
-        return lead
-
-    @app.put("/leads/{lead_id}", response_model=Lead)
-    def update_lead(lead_id: int, update_data: LeadUpdate):
-        # Check if lead exists
-        lead = crm.get_lead(lead_id)
-        if lead is None:
-            raise HTTPException(status_code=404, detail="Lead not found")
-
-        # Check for duplicate email if email is being updated
-        if update_data.email.lower() != lead["email"].lower():
-            existing_leads = crm.search_leads({"email": update_data.email.lower()})
-            if existing_leads:
-                raise HTTPException(status_code=400, detail="A lead with this email already exists")
-
+    @app.post("/leads/bulk", response_model=List[Lead])
+    def create_leads_bulk(leads_data: List[LeadCreate], crm: CRM = Depends(get_crm)):
+        # Leads whose email already exists are skipped
         try:
-            crm.update_lead(lead_id, update_data.model_dump())
-            return crm.get_lead(lead_id)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-
-    @app.delete("/leads/{lead_id}", response_model=Dict)
-    def delete_lead(lead_id: int):
-        lead = crm.get_lead(lead_id)
-        if lead is None:
-            raise HTTPException(status_code=404, detail="Lead not found")
-        crm.delete_lead(lead_id)
-        return {"message": "Lead deleted"}
-
-    @app.get("/leads/", response_model=List[Lead])
-    def search_leads(status: Optional[str] = None, url: Optional[str] = None):
-        filters = {}
-        if status:
-            filters["status"] = status
-        if url:
-            filters["url"] = url
-        return crm.search_leads(filters)
-
-    # Action endpoints
-    @app.post("/actions/", response_model=Dict)
-    def create_action(action_data: Dict[str, Union[str, int, float]]):
-        # Map 'description' to 'details' for compatibility
-        if 'description' in action_data:
-            action_data['details'] = action_data.pop('description')
-        action_id = crm.create_action(action_data)
-        # Return both fields for compatibility
-        action = crm.get_action(action_id)
-        result = {"id": action_id, **action}
-        if 'details' in result:
-            result['description'] = result['details']
-        return result
-
-    @app.get("/actions/{action_id}", response_model=Dict)
-    def get_action(action_id: int):
-        action = crm.get_action(action_id)
-        if action is None:
-            raise HTTPException(status_code=404, detail="Action not found")
-        return action
-
-    @app.get("/actions/", response_model=List[Dict])
-    def search_actions(action_type: Optional[str] = None):
-        filters = {}
-        if action_type:
-            filters["action_type"] = action_type
-        return crm.search_actions(filters)
-
-    # Process endpoints
-    @app.get("/processes/{process_id}", response_model=Dict)
-    def get_process(process_id: int):
-        process = crm.get_process(process_id)
-        if process is None:
-            raise HTTPException(status_code=404, detail="Process not found")
-        return process
-
-    @app.get("/processes/", response_model=List[Dict])
-    def search_processes(status: Optional[str] = None):
-        filters = {}
-        if status:
-            filters["status"] = status
-        return crm.search_processes(filters)
-
-    return app
-
-def create_app_with_db(db_path: str):
-    app = FastAPI(title="CRM API", description="REST API for CRM operations (test db)")
-    crm = CRM(db_path)
-
-    # Lead endpoints
-    @app.post("/leads/", response_model=Lead)
-    def create_lead(lead_data: LeadCreate):
-        # Check for duplicate email
-        existing_leads = crm.search_leads({"email": lead_data.email.lower()})
-        if existing_leads:
-            raise HTTPException(status_code=400, detail="A lead with this email already exists")
-        
-        try:
-            lead_id = crm.create_lead(lead_data.model_dump())
-            return {**lead_data.model_dump(), "id": lead_id}
+            created = crm.create_leads_bulk([lead_data.model_dump() for lead_data in leads_data])
+            return [Lead.model_construct(**lead) for lead in created]
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
     @app.get("/leads/{lead_id}", response_model=Lead)
-    def get_lead(lead_id: int):
-        lead = crm.get_lead(lead_id)
+    async def get_lead(lead_id: int, request: Request, response: Response, crm: CRM = Depends(get_crm)):
+        lead = await asyncio.to_thread(crm.get_lead, lead_id)
         if lead is None:
             raise HTTPException(status_code=404, detail="Lead not found")
-        return lead
+        # Unchanged since the client's copy: skip serializing the body
+        etag = _etag(lead)
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        # Stored leads were validated on the way in, so skip revalidation;
+        # FastAPI 0.128+ passes a returned model instance through as is
+        # (older releases dumped it to a dict and validated that again)
+        return Lead.model_construct(**lead)
 
     @app.put("/leads/{lead_id}", response_model=Lead)
-    def update_lead(lead_id: int, update_data: LeadUpdate):
-        # Check if lead exists
-        lead = crm.get_lead(lead_id)
-        if lead is None:
-            raise HTTPException(status_code=404, detail="Lead not found")
-
-        # Check for duplicate email if email is being updated
-        if update_data.email.lower() != lead["email"].lower():
-            existing_leads = crm.search_leads({"email": update_data.email.lower()})
-            if existing_leads:
-                raise HTTPException(status_code=400, detail="A lead with this email already exists")
-
+    def update_lead(lead_id: int, update_data: LeadUpdate, crm: CRM = Depends(get_crm)):
+        # Duplicate emails are rejected by the unique index on update
         try:
-            crm.update_lead(lead_id, update_data.model_dump())
-            return crm.get_lead(lead_id)
+            lead = crm.update_lead(lead_id, update_data.model_dump())
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
+        if lead is None:
+            raise HTTPException(status_code=404, detail="Lead not found")
+        return Lead.model_construct(**lead)
 
     @app.delete("/leads/{lead_id}", response_model=Dict)
-    def delete_lead(lead_id: int):
-        lead = crm.get_lead(lead_id)
-        if lead is None:
+    def delete_lead(lead_id: int, crm: CRM = Depends(get_crm)):
+        if not crm.delete_lead(lead_id):
             raise HTTPException(status_code=404, detail="Lead not found")
-        crm.delete_lead(lead_id)
         return {"message": "Lead deleted"}
 
     @app.get("/leads/", response_model=List[Lead])
-    def search_leads(status: Optional[str] = None, url: Optional[str] = None):
+    async def search_leads(status: Optional[str] = None, url: Optional[str] = None, crm: CRM = Depends(get_crm)):
         filters = {}
         if status:
             filters["status"] = status
         if url:
             filters["url"] = url
-        return crm.search_leads(filters)
+        leads = await asyncio.to_thread(crm.search_leads, filters)
+        return [Lead.model_construct(**lead) for lead in leads]
 
     # Action endpoints
     @app.post("/actions/", response_model=Dict)
-    def create_action(action_data: Dict[str, Union[str, int, float]]):
+    def create_action(action_data: Dict[str, Union[str, int, float]], crm: CRM = Depends(get_crm)):
         # Map 'description' to 'details' for compatibility
         if 'description' in action_data:
             action_data['details'] = action_data.pop('description')
-        action_id = crm.create_action(action_data)
+        # The stored row, including its timestamp, comes back from the insert
+        result = crm.create_action(action_data)
         # Return both fields for compatibility
-        action = crm.get_action(action_id)
-        result = {"id": action_id, **action}
         if 'details' in result:
             result['description'] = result['details']
         return result
 
     @app.get("/actions/{action_id}", response_model=Dict)
-    def get_action(action_id: int):
-        action = crm.get_action(action_id)
+    async def get_action(action_id: int, request: Request, response: Response, crm: CRM = Depends(get_crm)):
+        action = await asyncio.to_thread(crm.get_action, action_id)
         if action is None:
             raise HTTPException(status_code=404, detail="Action not found")
+        etag = _etag(action)
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         return action
 
     @app.get("/actions/", response_model=List[Dict])
-    def search_actions(action_type: Optional[str] = None):
+    async def search_actions(action_type: Optional[str] = None, crm: CRM = Depends(get_crm)):
         filters = {}
         if action_type:
             filters["action_type"] = action_type
-        return crm.search_actions(filters)
+        return await asyncio.to_thread(crm.search_actions, filters)
 
     # Process endpoints
     @app.get("/processes/{process_id}", response_model=Dict)
-    def get_process(process_id: int):
-        process = crm.get_process(process_id)
+    async def get_process(process_id: int, request: Request, response: Response, crm: CRM = Depends(get_crm)):
+        process = await asyncio.to_thread(crm.get_process, process_id)
         if process is None:
             raise HTTPException(status_code=404, detail="Process not found")
+        etag = _etag(process)
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         return process
 
     @app.get("/processes/", response_model=List[Dict])
-    def search_processes(status: Optional[str] = None):
+    async def search_processes(status: Optional[str] = None, crm: CRM = Depends(get_crm)):
         filters = {}
         if status:
             filters["status"] = status
-        return crm.search_processes(filters)
+        return await asyncio.to_thread(crm.search_processes, filters)
+
+def create_app(db_path: Optional[str] = None) -> FastAPI:
+    """Create the API app; its CRM is opened on startup from db_path or DATABASE_URL."""
+    # Database debug logging is only formatted when LOG_LEVEL=DEBUG. Only the
+    # crm logger's level is set; handlers come from uvicorn's log config or
+    # the entrypoint, and an unknown level falls back to INFO
+    log_level = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logging.getLogger("crm").setLevel(log_level if isinstance(log_level, int) else logging.INFO)
+    app = FastAPI(title="CRM API", description="REST API for CRM operations", lifespan=_lifespan)
+    app.state.db_path = db_path
+    _register_routes(app)
+    return app
+
+def create_app_with_db(db_path: str) -> FastAPI:
+    """Create the API app with its CRM opened straight away on db_path.
 
+    The caller owns that CRM: it outlives app shutdowns and is closed with
+    app.state.crm.close().
+    """
+    app = FastAPI(title="CRM API", description="REST API for CRM operations (test db)", lifespan=_lifespan)
+    app.state.db_path = db_path
+    app.state.crm = CRM(db_path)
+    _register_routes(app)
     return app
 
-app = create_app() 
\ No newline at end of file
+def get_app() -> FastAPI:
+    """uvicorn factory: uvicorn crm.api:get_app --factory"""
+    return create_app()
@@ -0,0 +1,38 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 1.0):
+        """Initialize a cache whose entries expire ttl seconds after being set"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Cache value under key, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
@@ -1,131 +1,291 @@
+import functools
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Union
+from .cache import TTLCache
 from .database import Database
 
+logger = logging.getLogger(__name__)
+
+# Columns returned by reads; leads match the fields of the Lead response model
+LEAD_COLUMNS = ["id", "name", "email", "status", "url"]
+ACTION_COLUMNS = ["id", "lead_id", "action_type", "details", "timestamp"]
+PROCESS_COLUMNS = ["id", "name", "lead_id", "channel", "last_action_id",
+                   "next_followup_datetime", "status"]
+
+def _raise_if_duplicate_email(error: sqlite3.IntegrityError):
+    """Translate a unique email violation into the duplicate lead error."""
+    if "leads.email" in str(error) and "UNIQUE" in str(error):
+        raise ValueError("A lead with this email already exists") from error
+
+def _invalidates_searches(method):
+    """Clear the CRM's cached search results once the wrapped write has run."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            # Bumping the version stops searches that read before the write
+            # from caching their (possibly stale) rows
+            with self._search_lock:
+                self._search_version += 1
+                self._search_cache.clear()
+    return wrapper
+
 class CRM:
-    def __init__(self, db_path: str):
-        """Initialize the CRM with a database connection."""
-        self.db = Database(db_path)
-        self._init_db()
+    def __init__(self, db_path: str, search_cache_ttl: float = 1.0,
+                 pragmas: Optional[Dict[str, Union[str, int]]] = None):
+        """Initialize the CRM with a database connection.
+
+        Search results are cached for search_cache_ttl seconds and dropped
+        on every write made through this CRM. pragmas override the
+        database's default connection pragmas.
+        """
+        self.db = Database(db_path, pragmas)
+        self._search_cache = TTLCache(maxsize=1024, ttl=search_cache_ttl)
+        self._search_lock = threading.Lock()
+        self._search_version = 0
+        try:
+            self._init_db()
+        except BaseException:
+            self.db.close()
+            raise
 
     def _init_db(self):
         """Initialize the database with required tables"""
-        # Create leads table
-        self.db.create_collection("leads", {
-            "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
-            "name": "TEXT",
-            "email": "TEXT",
-            "status": "TEXT NOT NULL DEFAULT 'new'",
-            "url": "TEXT"
-        })
-
-        # Create actions table
-        self.db.create_collection("actions", {
-            "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
-            "lead_id": "INTEGER",
-            "action_type": "TEXT",
-            "details": "TEXT",
-            "timestamp": "TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))"
-        })
-
-        # Create processes table
-        self.db.create_collection("processes", {
-            "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
-            "name": "TEXT",
-            "lead_id": "INTEGER",
-            "channel": "TEXT",
-            "last_action_id": "INTEGER",
-            "next_followup_datetime": "TEXT",
-            "status": "TEXT"
-        })
+        # Build the whole schema in one transaction (a single commit)
+        with self.db.transaction():
+            # Create leads table
+            self.db.create_collection("leads", {
+                "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+                "name": "TEXT",
+                "email": "TEXT NOT NULL",
+                "status": "TEXT NOT NULL DEFAULT 'new'",
+                "url": "TEXT"
+            })
+
+            # Create actions table
+            self.db.create_collection("actions", {
+                "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+                "lead_id": "INTEGER",
+                "action_type": "TEXT",
+                "details": "TEXT",
+                "timestamp": "TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))"
+            })
+
+            # Create processes table
+            self.db.create_collection("processes", {
+                "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+                "name": "TEXT",
+                "lead_id": "INTEGER",
+                "channel": "TEXT",
+                "last_action_id": "INTEGER",
+                "next_followup_datetime": "TEXT",
+                "status": "TEXT"
+            })
+
+            # Index the columns used for lookups; the unique email index also
+            # enforces that no two leads share an email
+            self._ensure_unique_lead_email_index()
+            self.db.create_index("leads", ["status"])
+            self.db.create_index("actions", ["lead_id"])
+            # At most one process per lead; create_action upserts on this index
+            self._ensure_unique_process_lead_index()
+            self.db.create_index("processes", ["status"])
+
+    def _ensure_unique_lead_email_index(self):
+        """Create the unique leads.email index, failing clearly if existing leads share an email"""
+        indexes = {row["name"]: row["unique"] for row in self.db.execute_query("PRAGMA index_list(leads)")}
+        if not indexes.get("idx_leads_email"):
+            # Databases created before the index existed may hold duplicate
+            # emails; merging leads would orphan their actions, so leave that
+            # to an operator
+            duplicates = [row["email"] for row in self.db.execute_query(
+                "SELECT email FROM leads WHERE email IS NOT NULL GROUP BY email HAVING COUNT(*) > 1 ORDER BY email")]
+            if duplicates:
+                raise RuntimeError("Cannot make leads.email unique; these emails belong to several leads: "
+                                   + ", ".join(duplicates))
+            self.db.execute_query("DROP INDEX IF EXISTS idx_leads_email")
+        self.db.create_index("leads", ["email"], unique=True)
+
+    def _ensure_unique_process_lead_index(self):
+        """Create the unique processes.lead_id index, replacing a non-unique one of the same name"""
+        indexes = {row["name"]: row["unique"] for row in self.db.execute_query("PRAGMA index_list(processes)")}
+        if indexes.get("idx_processes_lead_id"):
+            return
+        self.db.execute_query("DROP INDEX IF EXISTS idx_processes_lead_id")
+        # Databases created before the index was unique may hold several
+        # processes per lead. Actions always updated the lead's oldest one,
+        # so keep that and drop the later duplicates
+        duplicates = self.db.execute_query(
+            "SELECT COUNT(*) - COUNT(DISTINCT lead_id) AS count FROM processes WHERE lead_id IS NOT NULL")[0]["count"]
+        if duplicates:
+            self.db.execute_query(
+                "DELETE FROM processes WHERE lead_id IS NOT NULL AND id NOT IN "
+                "(SELECT MIN(id) FROM processes WHERE lead_id IS NOT NULL GROUP BY lead_id)")
+            logger.warning("Deleted %d duplicate processes to make processes.lead_id unique", duplicates)
+        self.db.create_index("processes", ["lead_id"], unique=True)
 
     def close(self):
         """Close the database connection."""
         self.db.close()
 
+    def _search(self, collection_name: str, filters: Optional[Dict[str, Union[str, int, float]]],
+                columns: List[str]) -> List[Dict]:
+        """Search a collection, reusing a recent result for the same filters."""
+        key = (collection_name, frozenset((filters or {}).items()))
+        results = self._search_cache.get(key)
+        if results is None:
+            with self._search_lock:
+                version = self._search_version
+            results = self.db.search(collection_name, filters, columns=columns)
+            with self._search_lock:
+                # Only cache rows no write has committed over since they were read
+                if version == self._search_version:
+                    self._search_cache.set(key, results)
+        return results
+
     # Lead operations
-    def create_lead(self, lead_data: Dict[str, Union[str, int, float]]) -> int:
-        """Create a new lead and return its ID."""
+    @_invalidates_searches
+    def create_lead(self, lead_data: Dict[str, Union[str, int, float]]) -> Dict:
+        """Create a new lead and return the stored lead."""
         # Default status to 'new' if not provided
         if "status" not in lead_data or lead_data["status"] is None:
             lead_data["status"] = "new"
         if lead_data["status"] is None:
             raise ValueError("Lead status cannot be None")
-        return self.db.insert("leads", lead_data)
+        try:
+            return self.db.insert_returning("leads", lead_data, LEAD_COLUMNS)
+        except sqlite3.IntegrityError as e:
+            _raise_if_duplicate_email(e)
+            raise
+
+    @_invalidates_searches
+    def create_leads_bulk(self, leads_data: List[Dict[str, Union[str, int, float]]]) -> List[Dict]:
+        """Create every lead whose email is not taken yet and return the created leads."""
+        new_leads = {}
+        for lead_data in leads_data:
+            email = lead_data["email"].lower()
+            # The first lead wins when the batch repeats an email; a multi-row
+            # insert needs every row to have the same columns
+            new_leads.setdefault(email, {
+                "name": lead_data.get("name"),
+                "email": email,
+                "status": lead_data.get("status") or "new",
+                "url": lead_data.get("url")
+            })
+        if not new_leads:
+            return []
+        # One transaction so no other writer can take an email between the
+        # duplicate check and the insert
+        with self.db.transaction():
+            # Find the emails that already exist, as many per query as SQLite
+            # allows bound parameters
+            emails = list(new_leads)
+            batch_size = self.db.max_variables
+            for start in range(0, len(emails), batch_size):
+                batch = emails[start:start + batch_size]
+                for lead in self.db.get("leads", {"email": ("IN", batch)}, columns=["email"]):
+                    del new_leads[lead["email"]]
+            if not new_leads:
+                return []
+            return self.db.insert_many_returning("leads", list(new_leads.values()), LEAD_COLUMNS)
 
     def get_lead(self, lead_id: int) -> Optional[Dict]:
         """Retrieve a lead by its ID."""
-        results = self.db.get("leads", {"id": lead_id})
+        results = self.db.get("leads", {"id": lead_id}, columns=LEAD_COLUMNS)
         return results[0] if results else None
 
-    def update_lead(self, lead_id: int, lead_data: Dict[str, Union[str, int, float]]) -> None:
-        """Update an existing lead."""
+    @_invalidates_searches
+    def update_lead(self, lead_id: int, lead_data: Dict[str, Union[str, int, float]]) -> Optional[Dict]:
+        """Update an existing lead and return it, or None if it does not exist."""
         if "status" in lead_data and lead_data["status"] is None:
             raise ValueError("Lead status cannot be None")
-        self.db.update("leads", lead_data, {"id": lead_id})
+        try:
+            return self.db.update_returning("leads", lead_data, {"id": lead_id}, LEAD_COLUMNS)
+        except sqlite3.IntegrityError as e:
+            _raise_if_duplicate_email(e)
+            raise
 
-    def delete_lead(self, lead_id: int) -> None:
-        """Delete a lead by its ID."""
-        self.db.delete("leads", {"id": lead_id})
+    @_invalidates_searches
+    def delete_lead(self, lead_id: int) -> bool:
+        """Delete a lead by its ID and return whether it existed."""
+        return self.db.delete("leads", {"id": lead_id}) > 0
 
     def search_leads(self, filters: Dict[str, Union[str, int, float]] = None) -> List[Dict]:
         """Search for leads based on filters."""
-        return self.db.search("leads", filters)
+        return self._search("leads", filters, LEAD_COLUMNS)
 
     # Action operations
-    def create_action(self, action_data: Dict[str, Union[str, int, float]]) -> int:
-        """Create a new action and return its ID."""
-        from datetime import datetime, timedelta
+    def _follow_up(self, action: Dict):
+        """Point the action's lead's process at it, creating the process on the first action."""
+        # Calculate next followup datetime (7 days after action's timestamp)
+        next_followup = (datetime.strptime(action["timestamp"], "%Y-%m-%d %H:%M:%S") + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
+        process_data = {
+            "lead_id": action["lead_id"],
+            "channel": action["action_type"],
+            "last_action_id": action["id"],
+            "next_followup_datetime": next_followup,
+            "status": "active"
+        }
+        self.db.upsert("processes", process_data, ["lead_id"],
+                       ["channel", "last_action_id", "next_followup_datetime"])
+
+    @_invalidates_searches
+    def create_action(self, action_data: Dict[str, Union[str, int, float]]) -> Dict:
+        """Create a new action and return the stored action."""
         # Insert action with timestamp
         if "timestamp" not in action_data or not action_data["timestamp"]:
             action_data["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        action_id = self.db.insert("actions", action_data)
-        # Get the action's timestamp (from DB, in case DB sets it)
-        action = self.get_action(action_id)
-        action_timestamp = action["timestamp"]
-        # Check if a process already exists for this lead
-        existing_processes = self.db.search("processes", {"lead_id": action_data["lead_id"]})
-        # Calculate next followup datetime (7 days after action's timestamp)
-        next_followup = (datetime.strptime(action_timestamp, "%Y-%m-%d %H:%M:%S") + timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-        if not existing_processes:
-            # Create new process for first action
-            process_data = {
-                "lead_id": action_data["lead_id"],
-                "channel": action_data["action_type"],
-                "last_action_id": action_id,
-                "next_followup_datetime": next_followup,
-                "status": "active"
-            }
-            self.db.insert("processes", process_data)
-        else:
-            # Update existing process
-            process = existing_processes[0]
-            update_data = {
-                "channel": action_data["action_type"],
-                "last_action_id": action_id,
-                "next_followup_datetime": next_followup
-            }
-            self.db.update("processes", update_data, {"id": process["id"]})
-        return action_id
+        # The action and its process change are committed together
+        with self.db.transaction():
+            action = self.db.insert_returning("actions", action_data, ACTION_COLUMNS)
+            self._follow_up(action)
+        return action
+
+    @_invalidates_searches
+    def create_actions(self, actions_data: List[Dict[str, Union[str, int, float]]]) -> List[Dict]:
+        """Create several actions in one transaction and return the stored actions in order."""
+        if not actions_data:
+            return []
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # A multi-row insert needs every row to have the same columns
+        rows = [{
+            "lead_id": action_data["lead_id"],
+            "action_type": action_data.get("action_type"),
+            "details": action_data.get("details"),
+            "timestamp": action_data.get("timestamp") or now
+        } for action_data in actions_data]
+        with self.db.transaction():
+            actions = self.db.insert_many_returning("actions", rows, ACTION_COLUMNS)
+            # Each lead's process follows only its latest action
+            latest = {action["lead_id"]: action for action in actions}
+            for action in latest.values():
+                self._follow_up(action)
+        return actions
 
     def get_action(self, action_id: int) -> Optional[Dict]:
         """Retrieve an action by its ID."""
-        results = self.db.get("actions", {"id": action_id})
+        results = self.db.get("actions", {"id": action_id}, columns=ACTION_COLUMNS)
         return results[0] if results else None
 
     def search_actions(self, filters: Dict[str, Union[str, int, float]] = None) -> List[Dict]:
         """Search for actions based on filters."""
-        return self.db.search("actions", filters)
+        return self._search("actions", filters, ACTION_COLUMNS)
 
     # Process operations
-    def create_process(self, process_data: Dict[str, Union[str, int, float]]) -> int:
-        """Create a new process and return its ID."""
-        return self.db.insert("processes", process_data)
+    @_invalidates_searches
+    def create_process(self, process_data: Dict[str, Union[str, int, float]]) -> Dict:
+        """Create a new process, or replace the lead's existing one, and return the stored process."""
+        return self.db.upsert_returning("processes", process_data, ["lead_id"], PROCESS_COLUMNS)
 
     def get_process(self, process_id: int) -> Optional[Dict]:
         """Retrieve a process by its ID."""
-        results = self.db.get("processes", {"id": process_id})
+        results = self.db.get("processes", {"id": process_id}, columns=PROCESS_COLUMNS)
         return results[0] if results else None
 
     def search_processes(self, filters: Dict[str, Union[str, int, float]] = None) -> List[Dict]:
         """Search for processes based on filters."""
-        return self.db.search("processes", filters) 
\ No newline at end of file
+        return self._search("processes", filters, PROCESS_COLUMNS) 
\ No newline at end of file
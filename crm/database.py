@@ -1,34 +1,184 @@
+import logging
 import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import Dict, List, Tuple, Union, Optional
-import time
+
+logger = logging.getLogger(__name__)
+
+# Applied once when the connection is opened; Database(pragmas=...) overrides them
+_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+    "cache_size": -65536,
+    "foreign_keys": "ON",
+    # Schema-embedded SQL may only call functions marked innocuous
+    "trusted_schema": "OFF",
+}
+
+def _render_condition(key: str, operator: str, size: Optional[int]) -> str:
+    """Render one WHERE condition; size is the number of values of an IN list"""
+    if size is None:
+        return f"{key} {operator} ?"
+    return f"{key} {operator} ({', '.join(['?'] * size)})"
+
+# SQLite's default limit on bound parameters per statement (3.32+)
+_MAX_VARIABLES = 32766
+
+def _max_variables(conn: sqlite3.Connection) -> int:
+    """Return the connection's limit on bound parameters, which depends on how SQLite was built"""
+    # Connection.getlimit is new in Python 3.11; older versions assume the default
+    if hasattr(conn, "getlimit"):
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    return _MAX_VARIABLES
+
+@lru_cache(maxsize=256)
+def _build_insert(collection_name: str, keys: Tuple[str, ...], row_count: int = 1) -> str:
+    """Build a parameterized INSERT of row_count rows for the given columns"""
+    row = f"({', '.join(['?'] * len(keys))})"
+    return f"INSERT INTO {collection_name} ({', '.join(keys)}) VALUES {', '.join([row] * row_count)}"
+
+@lru_cache(maxsize=256)
+def _build_upsert(collection_name: str, keys: Tuple[str, ...], conflict_columns: Tuple[str, ...],
+                  update_columns: Tuple[str, ...], returning: Tuple[str, ...] = ("id",)) -> str:
+    """Build a parameterized INSERT ... ON CONFLICT DO UPDATE returning the given columns"""
+    set_clause = ', '.join(f"{key} = excluded.{key}" for key in update_columns)
+    return (f"{_build_insert(collection_name, keys)} "
+            f"ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET {set_clause} "
+            f"RETURNING {', '.join(returning)}")
+
+@lru_cache(maxsize=256)
+def _build_update(collection_name: str, keys: Tuple[str, ...], filter_keys: Tuple[str, ...],
+                  returning: Optional[Tuple[str, ...]] = None) -> str:
+    """Build a parameterized UPDATE of the given columns, optionally returning columns of the updated rows"""
+    set_clause = ', '.join(f"{key} = ?" for key in keys)
+    where_clause = ' AND '.join(f"{key} = ?" for key in filter_keys)
+    query = f"UPDATE {collection_name} SET {set_clause} WHERE {where_clause}"
+    if returning is not None:
+        query += f" RETURNING {', '.join(returning) if returning else '*'}"
+    return query
+
+@lru_cache(maxsize=256)
+def _build_delete(collection_name: str, filter_keys: Tuple[str, ...]) -> str:
+    """Build a parameterized DELETE matching all of the given columns"""
+    return f"DELETE FROM {collection_name} WHERE {' AND '.join(f'{key} = ?' for key in filter_keys)}"
+
+@lru_cache(maxsize=512)
+def _build_select(collection_name: str, conditions: Tuple[Tuple[str, str, Optional[int]], ...],
+                  order_by: Optional[str] = None, columns: Optional[Tuple[str, ...]] = None) -> str:
+    """Build a parameterized SELECT for the given (column, operator, size) conditions"""
+    select_list = ", ".join(columns) if columns else "*"
+    query = f"SELECT {select_list} FROM {collection_name}"
+    if conditions:
+        query += " WHERE " + " AND ".join(_render_condition(*condition) for condition in conditions)
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    return query
+
+def _is_private(db_path: str) -> bool:
+    """Return whether every connection to db_path opens a separate database"""
+    if db_path in ("", ":memory:"):
+        return True
+    in_memory = db_path.startswith("file::memory:") or "mode=memory" in db_path
+    return db_path.startswith("file:") and in_memory and "cache=shared" not in db_path
+
+class _SharedConnection:
+    """A connection with the lock and savepoint depth of every Database using it"""
+    def __init__(self, conn: sqlite3.Connection, pragmas: Dict[str, Union[str, int]]):
+        self.conn = conn
+        self.pragmas = pragmas
+        self.lock = threading.RLock()
+        self.savepoint_depth = 0
+        self.refs = 0
+
+# Databases opened on the same path share one connection, closed when the
+# last of them closes; private databases such as ":memory:" are never pooled
+_POOL: Dict[str, _SharedConnection] = {}
+_POOL_LOCK = threading.Lock()
 
 class Database:
-    def __init__(self, db_path: str):
-        """Initialize database connection"""
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, Union[str, int]]] = None):
+        """Initialize database connection, with pragmas overriding the default connection pragmas
+
+        A path that is already open reuses that connection, keeping the
+        pragmas it was opened with; a warning is logged if they differ.
+        """
         self.db_path = db_path
+        self._pooled = not _is_private(db_path)
+        settings = {**_PRAGMAS, **(pragmas or {})}
+        with _POOL_LOCK:
+            shared = _POOL.get(db_path) if self._pooled else None
+            if shared is not None and shared.pragmas != settings:
+                logger.warning("%s is already open with pragmas %s; ignoring %s",
+                               db_path, shared.pragmas, settings)
+            if shared is None:
+                # One long-lived connection shared by every call; autocommit mode so
+                # each statement is durable on its own without an explicit COMMIT.
+                # "file:" paths are SQLite URIs, e.g. file:name?mode=memory&cache=shared.
+                conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                                       cached_statements=256, uri=db_path.startswith("file:"))
+                conn.executescript("".join(f"PRAGMA {key}={value};" for key, value in settings.items()))
+                shared = _SharedConnection(conn, settings)
+                if self._pooled:
+                    _POOL[db_path] = shared
+            shared.refs += 1
+        self._shared = shared
+        self._conn = shared.conn
+        self._lock = shared.lock
+        # Callers binding many values (e.g. long IN lists) split them into batches of this size
+        self.max_variables = _max_variables(shared.conn)
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Return the shared database connection"""
+        return self._conn
 
-    def get_connection(self):
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed statements as one transaction, rolled back if an exception escapes"""
+        with self._lock:
+            if self._conn.in_transaction:
+                # Already inside a transaction: nest with a savepoint so only
+                # this block is undone on error
+                self._shared.savepoint_depth += 1
+                savepoint = f"sp_{self._shared.savepoint_depth}"
+                self._conn.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    yield
+                except BaseException:
+                    self._conn.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                    raise
+                finally:
+                    self._conn.execute(f"RELEASE SAVEPOINT {savepoint}")
+                    self._shared.savepoint_depth -= 1
+            else:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
 
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict]:
         """Execute a SQL query and return results as a list of dictionaries"""
-        print(f"\n[DEBUG] Executing query: {query}")
-        print(f"[DEBUG] With params: {params}")
-        
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Executing query: %s params=%s", query, params)
+
+        with self._lock:
+            cursor = self._conn.execute(query, params)
             
-            # For non-SELECT queries, commit changes
-            if not query.strip().upper().startswith('SELECT'):
-                conn.commit()
+            # Statements that produce no rows are committed by autocommit mode
+            if cursor.description is None:
                 return []
             
-            # For SELECT queries, return results as list of dicts
+            # For row-returning queries (SELECT, PRAGMA), return results as list of dicts.
+            # Zipping plain tuples is faster than sqlite3.Row + dict(row), and a
+            # Row is not a drop-in dict: `"key" in row` tests values, not keys.
             columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            print(f"[DEBUG] Query results: {results}")
-            return results
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
     def create_collection(self, collection_name: str, columns: Dict[str, str]):
         """Create a new collection (table) with specified columns"""
@@ -36,87 +186,167 @@ class Database:
         query = f"CREATE TABLE IF NOT EXISTS {collection_name} ({', '.join(column_defs)})"
         self.execute_query(query)
 
+    def create_index(self, collection_name: str, columns: List[str], unique: bool = False):
+        """Create an index on the given columns of a collection if it does not exist"""
+        index_name = f"idx_{collection_name}_{'_'.join(columns)}"
+        unique_clause = "UNIQUE " if unique else ""
+        query = (f"CREATE {unique_clause}INDEX IF NOT EXISTS {index_name} "
+                 f"ON {collection_name} ({', '.join(columns)})")
+        self.execute_query(query)
+
     def insert(self, collection_name: str, data: Dict[str, Union[str, int, float]]) -> int:
         """Insert a new record into the collection"""
-        print(f"\n[DEBUG] Inserting into {collection_name}:")
-        print(f"[DEBUG] Data: {data}")
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO {collection_name} ({columns}) VALUES ({placeholders})"
-        
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, tuple(data.values()))
-            conn.commit()
+        query = _build_insert(collection_name, tuple(data.keys()))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Executing query: %s params=%s", query, tuple(data.values()))
+
+        with self._lock:
+            cursor = self._conn.execute(query, tuple(data.values()))
             return cursor.lastrowid
 
+    def insert_many(self, collection_name: str, rows: List[Dict[str, Union[str, int, float]]]) -> None:
+        """Insert several records in a single transaction, one executemany per column set"""
+        groups: Dict[Tuple[str, ...], List[Tuple]] = {}
+        for row in rows:
+            groups.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
+
+        with self.transaction():
+            for keys, values in groups.items():
+                query = _build_insert(collection_name, keys)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Executing query: %s rows=%d", query, len(values))
+                self._conn.executemany(query, values)
+
+    def insert_returning(self, collection_name: str, data: Dict[str, Union[str, int, float]],
+                         returning: List[str]) -> Dict:
+        """Insert a new record and return the requested columns of the stored row"""
+        query = f"{_build_insert(collection_name, tuple(data.keys()))} RETURNING {', '.join(returning)}"
+        return self.execute_query(query, tuple(data.values()))[0]
+
+    def insert_many_returning(self, collection_name: str, rows: List[Dict[str, Union[str, int, float]]],
+                              returning: List[str]) -> List[Dict]:
+        """Insert records that share the same columns and return the requested columns of each, in order"""
+        if not rows:
+            return []
+        keys = tuple(rows[0].keys())
+        # executemany cannot return rows, so insert as many rows per statement
+        # as the parameter limit allows
+        batch_size = max(1, self.max_variables // len(keys))
+        results = []
+        with self.transaction():
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                query = f"{_build_insert(collection_name, keys, len(batch))} RETURNING {', '.join(returning)}"
+                params = tuple(row[key] for row in batch for key in keys)
+                results.extend(self.execute_query(query, params))
+        # SQLite does not promise RETURNING order; the ids follow insertion order
+        if "id" in returning:
+            results.sort(key=lambda row: row["id"])
+        return results
+
+    def upsert(self, collection_name: str, data: Dict[str, Union[str, int, float]],
+               conflict_columns: List[str], update_columns: Optional[List[str]] = None) -> int:
+        """Insert a record, or update the row it conflicts with, and return the row's id"""
+        if update_columns is None:
+            update_columns = [key for key in data if key not in conflict_columns]
+        query = _build_upsert(collection_name, tuple(data.keys()), tuple(conflict_columns),
+                              tuple(update_columns))
+        return self.execute_query(query, tuple(data.values()))[0]["id"]
+
+    def upsert_returning(self, collection_name: str, data: Dict[str, Union[str, int, float]],
+                         conflict_columns: List[str], returning: List[str],
+                         update_columns: Optional[List[str]] = None) -> Dict:
+        """Insert a record, or update the row it conflicts with, and return the requested columns of that row"""
+        if update_columns is None:
+            update_columns = [key for key in data if key not in conflict_columns]
+        query = _build_upsert(collection_name, tuple(data.keys()), tuple(conflict_columns),
+                              tuple(update_columns), tuple(returning))
+        return self.execute_query(query, tuple(data.values()))[0]
+
     def get(self, collection_name: str, 
-            filters: Optional[Dict[str, Union[str, int, float, Tuple[str, Union[str, int, float]]]]] = None,
-            order_by: Optional[str] = None) -> List[Dict]:
-        """Retrieve records from the collection with optional filtering and ordering"""
-        print(f"\n[DEBUG] Getting from {collection_name}:")
-        print(f"[DEBUG] Filters: {filters}")
-        query = f"SELECT * FROM {collection_name}"
+            filters: Optional[Dict[str, Union[str, int, float, Tuple[str, Union[str, int, float, List]]]]] = None,
+            order_by: Optional[str] = None,
+            columns: Optional[List[str]] = None) -> List[Dict]:
+        """Retrieve records (all columns unless columns is given) with optional filtering and ordering"""
+        conditions = []
         params = []
-
-        if filters:
-            conditions = []
-            for key, value in filters.items():
-                if isinstance(value, tuple):
-                    operator, val = value
-                    conditions.append(f"{key} {operator} ?")
-                    params.append(val)
+        for key, value in (filters or {}).items():
+            if isinstance(value, tuple):
+                operator, val = value
+                if isinstance(val, (list, tuple)):
+                    # e.g. ("IN", [...]) binds one placeholder per value
+                    conditions.append((key, operator, len(val)))
+                    params.extend(val)
                 else:
-                    conditions.append(f"{key} = ?")
-                    params.append(value)
-            query += " WHERE " + " AND ".join(conditions)
-
-        if order_by:
-            query += f" ORDER BY {order_by}"
+                    conditions.append((key, operator, None))
+                    params.append(val)
+            else:
+                conditions.append((key, "=", None))
+                params.append(value)
 
-        results = self.execute_query(query, tuple(params))
-        print(f"[DEBUG] Get results: {results}")
-        return results if results else []
+        query = _build_select(collection_name, tuple(conditions), order_by,
+                              tuple(columns) if columns else None)
+        return self.execute_query(query, tuple(params))
 
     def update(self, collection_name: str, 
               updates: Dict[str, Union[str, int, float]],
               filters: Dict[str, Union[str, int, float]]):
         """Update records in the collection"""
-        set_clause = ', '.join([f"{key} = ?" for key in updates.keys()])
-        where_clause = ' AND '.join([f"{key} = ?" for key in filters.keys()])
-        query = f"UPDATE {collection_name} SET {set_clause} WHERE {where_clause}"
+        query = _build_update(collection_name, tuple(updates.keys()), tuple(filters.keys()))
         params = list(updates.values()) + list(filters.values())
         self.execute_query(query, tuple(params))
 
-    def delete(self, collection_name: str, filters: Dict[str, Union[str, int, float]]):
-        """Delete records from the collection"""
-        where_clause = ' AND '.join([f"{key} = ?" for key in filters.keys()])
-        query = f"DELETE FROM {collection_name} WHERE {where_clause}"
-        self.execute_query(query, tuple(filters.values()))
+    def update_returning(self, collection_name: str,
+                         updates: Dict[str, Union[str, int, float]],
+                         filters: Dict[str, Union[str, int, float]],
+                         returning: Optional[List[str]] = None) -> Optional[Dict]:
+        """Update records and return the first updated row, or None if nothing matched"""
+        # An empty returning tuple stands for RETURNING *
+        query = _build_update(collection_name, tuple(updates.keys()), tuple(filters.keys()),
+                              tuple(returning or ()))
+        params = list(updates.values()) + list(filters.values())
+        results = self.execute_query(query, tuple(params))
+        return results[0] if results else None
+
+    def delete(self, collection_name: str, filters: Dict[str, Union[str, int, float]]) -> int:
+        """Delete records from the collection and return how many were deleted"""
+        query = _build_delete(collection_name, tuple(filters.keys()))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Executing query: %s params=%s", query, tuple(filters.values()))
+
+        with self._lock:
+            return self._conn.execute(query, tuple(filters.values())).rowcount
 
     def add_column(self, collection_name: str, column_name: str, column_type: str):
         """Add a new column to an existing collection"""
         query = f"ALTER TABLE {collection_name} ADD COLUMN {column_name} {column_type}"
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query)
-            conn.commit()
-        # Wait a moment to ensure the file system is updated (for test environments)
-        time.sleep(0.05)
-
-    def search(self, collection_name: str, filters: Dict[str, Union[str, int, float]] = None) -> List[Dict]:
-        query = f"SELECT * FROM {collection_name}"
-        if filters:
-            where_clause = " AND ".join([f"{key} = ?" for key in filters.keys()])
-            query += f" WHERE {where_clause}"
-            return self.execute_query(query, tuple(filters.values()))
-        return self.execute_query(query)
+        self.execute_query(query)
 
-    def close(self):
-        """Close the database connection"""
-        if hasattr(self, '_connection') and self._connection:
-            self._connection.close()
-            self._connection = None
+    def search(self, collection_name: str, filters: Dict[str, Union[str, int, float]] = None,
+               columns: Optional[List[str]] = None) -> List[Dict]:
+        """Retrieve records matching all of the given equality filters"""
+        filters = filters or {}
+        query = _build_select(collection_name, tuple((key, "=", None) for key in filters), None,
+                              tuple(columns) if columns else None)
+        return self.execute_query(query, tuple(filters.values()))
 
-    def _set_connection(self, conn):
-        self._connection = conn 
\ No newline at end of file
+    def close(self):
+        """Release the connection, closing it once no other Database uses it"""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn = None
+            with _POOL_LOCK:
+                self._shared.refs -= 1
+                if self._shared.refs:
+                    return
+                if self._pooled:
+                    del _POOL[self.db_path]
+            try:
+                # Refresh query planner statistics; a no-op when nothing changed
+                self._shared.conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                # e.g. a read-only database; the connection is closed regardless
+                logger.warning("PRAGMA optimize failed on close: %s", e)
+            finally:
+                self._shared.conn.close()
\ No newline at end of file
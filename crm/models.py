@@ -1,23 +1,28 @@
-from pydantic import BaseModel, EmailStr, field_validator, ConfigDict
-from typing import Optional
+from pydantic import AfterValidator, BaseModel, EmailStr, ConfigDict
+from typing import Annotated, Optional
+
+# Validated email, lowercased by str.lower itself rather than a Python-level
+# validator method
+LowercaseEmail = Annotated[EmailStr, AfterValidator(str.lower)]
 
 class LeadBase(BaseModel):
     name: str
-    email: EmailStr
+    email: LowercaseEmail
     status: str = "new"
     url: Optional[str] = None
 
-    @field_validator('email')
-    @classmethod
-    def email_must_be_lowercase(cls, v):
-        return v.lower()
-
 class LeadCreate(LeadBase):
     pass
 
 class LeadUpdate(LeadBase):
     pass
 
-class Lead(LeadBase):
+class Lead(BaseModel):
+    # Response model: emails were validated and lowercased on the way in, so
+    # they are plain strings here and stored rows can skip revalidation
     id: int
+    name: str
+    email: str
+    status: str
+    url: Optional[str] = None
     model_config = ConfigDict(from_attributes=True) 
\ No newline at end of file
@@ -0,0 +1,49 @@
+import httpx
+import pytest
+import pytest_asyncio
+from crm.api import create_app, get_crm
+from crm.crm import CRM
+
+@pytest.fixture(scope="session")
+def shared_tmp(tmp_path_factory):
+    """One directory for every file-backed test database in the session"""
+    return tmp_path_factory.mktemp("crm_tests")
+
+@pytest.fixture(scope="session")
+def crm_conn():
+    """One in-memory CRM for the whole session, so the schema is created once"""
+    crm = CRM(":memory:")
+    yield crm
+    crm.close()
+
+@pytest.fixture
+def crm(crm_conn):
+    """The session CRM, with everything a test writes rolled back afterwards"""
+    conn = crm_conn.db.get_connection()
+    conn.execute("SAVEPOINT test_sp")
+    yield crm_conn
+    conn.execute("ROLLBACK TO SAVEPOINT test_sp")
+    conn.execute("RELEASE SAVEPOINT test_sp")
+    # Searches cached during the test may name rows that were rolled back
+    crm_conn._search_cache.clear()
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def api_client(crm_conn):
+    """An async client calling the app in-process, with every route using the session CRM"""
+    app = create_app()
+    app.dependency_overrides[get_crm] = lambda: crm_conn
+    # ASGITransport never runs the app's lifespan, so no database is opened
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        yield client
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def client(api_client, crm):
+    """The session client, with each test's writes rolled back"""
+    return api_client
+
+@pytest.fixture
+def lead_id(crm):
+    """The id of a new lead, created straight through the CRM"""
+    return crm.create_lead({"name": "Test Lead", "email": "test@example.com", "status": "new"})["id"]
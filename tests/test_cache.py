@@ -0,0 +1,29 @@
+import time
+from crm.cache import TTLCache
+
+def test_get_and_set():
+    """Test that cached values are returned until cleared"""
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get("leads") is None
+    cache.set("leads", [{"id": 1}])
+    assert cache.get("leads") == [{"id": 1}]
+    cache.clear()
+    assert cache.get("leads") is None
+
+def test_expiry():
+    """Test that entries expire after the TTL"""
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("leads", [{"id": 1}])
+    time.sleep(0.02)
+    assert cache.get("leads") is None
+
+def test_evicts_least_recently_used():
+    """Test that the least recently used entry is evicted when full"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
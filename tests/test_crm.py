@@ -1,416 +1,433 @@
-import unittest
-import os
-import tempfile
+import logging
+import pytest
+import sqlite3
+from freezegun import freeze_time
 from crm.crm import CRM
-import time
-
-class TestCRM(unittest.TestCase):
-    def setUp(self):
-        # Create a temporary database file for testing
-        self.temp_dir = tempfile.mkdtemp()
-        self.db_path = os.path.join(self.temp_dir, 'test.db')
-        self.crm = CRM(self.db_path)
-
-    def tearDown(self):
-        """Clean up after each test"""
-        # Close the CRM instance
-        self.crm.close()
-        
-        # Wait a moment for the connection to fully close
-        time.sleep(0.1)
-        
-        # Try to remove the test database file
-        try:
-            if os.path.exists(self.db_path):
-                os.remove(self.db_path)
-        except PermissionError:
-            # If we can't remove it now, it will be cleaned up later
-            pass
-
-    def test_create_lead(self):
-        """Test creating a new lead"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        self.assertIsNotNone(lead_id)
-        # Verify lead exists
-        lead = self.crm.get_lead(lead_id)
-        self.assertEqual(lead["name"], "Test Lead")
-        self.assertEqual(lead["email"], "test@example.com")
-        self.assertEqual(lead["status"], "new")
-
-    def test_update_lead(self):
-        """Test updating an existing lead"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        update_data = {"status": "contacted"}
-        self.crm.update_lead(lead_id, update_data)
-        lead = self.crm.get_lead(lead_id)
-        self.assertEqual(lead["status"], "contacted")
-
-    def test_delete_lead(self):
-        """Test deleting a lead"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        self.crm.delete_lead(lead_id)
-        lead = self.crm.get_lead(lead_id)
-        self.assertIsNone(lead)
-
-    def test_create_action(self):
-        """Test creating a new action"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        action_data = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Sent initial email"
-        }
-        action_id = self.crm.create_action(action_data)
-        self.assertIsNotNone(action_id)
-        # Verify action exists
-        action = self.crm.get_action(action_id)
-        self.assertEqual(action["lead_id"], lead_id)
-        self.assertEqual(action["action_type"], "email")
-        self.assertEqual(action["details"], "Sent initial email")
-
-    def test_create_process(self):
-        """Test creating a new process"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        action_data = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Sent initial email"
-        }
-        action_id = self.crm.create_action(action_data)
-        process_data = {
-            "lead_id": lead_id,
-            "channel": "email",
-            "last_action_id": action_id,
-            "next_followup_datetime": "2023-10-01 10:00:00",
-            "status": "active"
-        }
-        process_id = self.crm.create_process(process_data)
-        self.assertIsNotNone(process_id)
-        # Verify process exists
-        process = self.crm.get_process(process_id)
-        self.assertEqual(process["lead_id"], lead_id)
-        self.assertEqual(process["channel"], "email")
-        self.assertEqual(process["last_action_id"], action_id)
-        self.assertEqual(process["next_followup_datetime"], "2023-10-01 10:00:00")
-        self.assertEqual(process["status"], "active")
-
-    def test_search_leads(self):
-        """Test searching leads with filters"""
-        lead_data1 = {
-            "name": "Test Lead 1",
-            "email": "test1@example.com",
-            "status": "new"
-        }
-        lead_data2 = {
-            "name": "Test Lead 2",
-            "email": "test2@example.com",
-            "status": "contacted"
-        }
-        self.crm.create_lead(lead_data1)
-        self.crm.create_lead(lead_data2)
-        # Search for leads with status "new"
-        leads = self.crm.search_leads({"status": "new"})
-        self.assertEqual(len(leads), 1)
-        self.assertEqual(leads[0]["name"], "Test Lead 1")
-
-    def test_search_actions(self):
-        """Test searching actions with filters"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        action_data1 = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Sent initial email"
-        }
-        action_data2 = {
-            "lead_id": lead_id,
-            "action_type": "follow-up",
-            "details": "Sent follow-up email"
-        }
-        self.crm.create_action(action_data1)
-        self.crm.create_action(action_data2)
-        # Search for actions with action_type "email"
-        actions = self.crm.search_actions({"action_type": "email"})
-        self.assertEqual(len(actions), 1)
-        self.assertEqual(actions[0]["details"], "Sent initial email")
-
-    def test_search_processes(self):
-        """Test searching processes with filters"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        action_data = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Sent initial email"
-        }
-        action_id = self.crm.create_action(action_data)
-        # Do NOT manually create a process; it should be created by create_action
-        # Search for processes with status "active"
-        processes = self.crm.search_processes({"status": "active"})
-        self.assertEqual(len(processes), 1)
-        self.assertEqual(processes[0]["channel"], "email")
-        self.assertEqual(processes[0]["lead_id"], lead_id)
-        self.assertEqual(processes[0]["last_action_id"], action_id)
-
-    def test_only_one_process_per_lead(self):
-        """Test that there is only one process per lead, even after multiple actions"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        # First action
-        action_data1 = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Initial contact"
-        }
-        self.crm.create_action(action_data1)
-        # Second action
-        action_data2 = {
-            "lead_id": lead_id,
-            "action_type": "phone",
-            "details": "Phone follow-up"
-        }
-        self.crm.create_action(action_data2)
-        # Third action
-        action_data3 = {
-            "lead_id": lead_id,
-            "action_type": "meeting",
-            "details": "In-person meeting"
-        }
-        self.crm.create_action(action_data3)
-        # There should still be only one process for this lead
-        processes = self.crm.search_processes({"lead_id": lead_id})
-        self.assertEqual(len(processes), 1)
-
-    def test_new_lead_has_no_actions_or_process(self):
-        """Test that a new lead has no actions or process"""
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        
-        # Check no actions exist
-        actions = self.crm.search_actions({"lead_id": lead_id})
-        self.assertEqual(len(actions), 0)
-        
-        # Check no process exists
-        processes = self.crm.search_processes({"lead_id": lead_id})
-        self.assertEqual(len(processes), 0)
-
-    def test_first_action_creates_process(self):
-        """Test that creating first action for a lead automatically creates a process"""
-        # Create lead
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        
-        # Create first action
-        action_data = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Initial contact"
-        }
-        action_id = self.crm.create_action(action_data)
-        
-        # Verify process was created
-        processes = self.crm.search_processes({"lead_id": lead_id})
-        self.assertEqual(len(processes), 1)
-        process = processes[0]
-        
-        # Verify process details
-        self.assertEqual(process["lead_id"], lead_id)
-        self.assertEqual(process["last_action_id"], action_id)
-        self.assertEqual(process["channel"], "email")
-        self.assertEqual(process["status"], "active")
-        
-        # Verify next_followup_datetime is set to 7 days from now
-        from datetime import datetime, timedelta
-        expected_date = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d")
-        actual_date = datetime.strptime(process["next_followup_datetime"], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-        self.assertEqual(actual_date, expected_date)
-
-    def test_subsequent_action_updates_process(self):
-        """Test that creating subsequent actions updates the existing process"""
-        # Create lead and first action
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        
-        # Create first action
-        action_data1 = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Initial contact"
-        }
-        action_id1 = self.crm.create_action(action_data1)
-        
-        # Create second action
-        action_data2 = {
-            "lead_id": lead_id,
-            "action_type": "follow-up",
-            "details": "Follow-up contact"
-        }
-        action_id2 = self.crm.create_action(action_data2)
-        
-        # Verify process was updated
-        processes = self.crm.search_processes({"lead_id": lead_id})
-        self.assertEqual(len(processes), 1)
-        process = processes[0]
-        
-        # Verify process was updated with new action
-        self.assertEqual(process["last_action_id"], action_id2)
-        self.assertEqual(process["channel"], "follow-up")
-        
-        # Verify next_followup_datetime is still 7 days from now
-        from datetime import datetime, timedelta
-        expected_date = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d")
-        actual_date = datetime.strptime(process["next_followup_datetime"], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-        self.assertEqual(actual_date, expected_date)
-
-    def test_lead_with_url(self):
-        """Test creating and managing a lead with URL field"""
-        # Create lead with URL
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new",
-            "url": "https://example.com/profile"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        
-        # Verify lead was created with URL
-        lead = self.crm.get_lead(lead_id)
-        self.assertEqual(lead["name"], "Test Lead")
-        self.assertEqual(lead["email"], "test@example.com")
-        self.assertEqual(lead["url"], "https://example.com/profile")
-        
-        # Test updating URL
-        update_data = {"url": "https://example.com/updated-profile"}
-        self.crm.update_lead(lead_id, update_data)
-        
-        # Verify URL was updated
-        updated_lead = self.crm.get_lead(lead_id)
-        self.assertEqual(updated_lead["url"], "https://example.com/updated-profile")
-        
-        # Test searching by URL
-        search_results = self.crm.search_leads({"url": "https://example.com/updated-profile"})
-        self.assertEqual(len(search_results), 1)
-        self.assertEqual(search_results[0]["id"], lead_id)
-
-    def test_lead_status_default_and_mandatory(self):
-        """Test that lead status defaults to 'new' and is mandatory"""
-        # Test creating lead without status (should default to 'new')
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-        lead = self.crm.get_lead(lead_id)
-        self.assertEqual(lead["status"], "new")
-
-        # Test that status cannot be set to None
-        with self.assertRaises(ValueError):
-            self.crm.update_lead(lead_id, {"status": None})
-
-    def test_action_timestamp(self):
-        """Test that actions have a timestamp field"""
-        # Create lead
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-
-        # Create action
-        action_data = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Initial contact"
-        }
-        action_id = self.crm.create_action(action_data)
-
-        # Verify action has timestamp
-        action = self.crm.get_action(action_id)
-        self.assertIn("timestamp", action)
-        self.assertIsNotNone(action["timestamp"])
-
-    def test_process_followup_datetime(self):
-        """Test that process followup datetime is set to 7 days after last action"""
-        # Create lead
-        lead_data = {
-            "name": "Test Lead",
-            "email": "test@example.com"
-        }
-        lead_id = self.crm.create_lead(lead_data)
-
-        # Create first action
-        action_data = {
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Initial contact"
-        }
-        action_id = self.crm.create_action(action_data)
-
-        # Get the process that was created
-        processes = self.crm.search_processes({"lead_id": lead_id})
-        self.assertEqual(len(processes), 1)
-        process = processes[0]
-
-        # Get the action to check its timestamp
-        action = self.crm.get_action(action_id)
-        action_timestamp = action["timestamp"]
-
-        # Calculate expected followup datetime (7 days after action timestamp)
-        from datetime import datetime, timedelta
-        expected_followup = datetime.strptime(action_timestamp, "%Y-%m-%d %H:%M:%S") + timedelta(days=7)
-        actual_followup = datetime.strptime(process["next_followup_datetime"], "%Y-%m-%d %H:%M:%S")
-
-        # Verify followup datetime is set correctly
-        self.assertEqual(actual_followup, expected_followup)
-
-if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+
+# Date tests run at a fixed time so timestamps can be compared as strings;
+# processes follow up seven days after their last action
+FROZEN_TIME = "2024-01-01 12:00:00"
+FOLLOWUP_TIME = "2024-01-08 12:00:00"
+
+def test_create_lead(crm):
+    """Test creating a new lead"""
+    lead_data = {
+        "name": "Test Lead",
+        "email": "test@example.com",
+        "status": "new"
+    }
+    # The stored lead comes back from create_lead
+    lead = crm.create_lead(lead_data)
+    assert lead["id"] is not None
+    assert lead["name"] == "Test Lead"
+    assert lead["email"] == "test@example.com"
+    assert lead["status"] == "new"
+
+def test_update_lead(crm, lead_id):
+    """Test updating an existing lead"""
+    update_data = {"status": "contacted"}
+    updated_lead = crm.update_lead(lead_id, update_data)
+    assert updated_lead["status"] == "contacted"
+    lead = crm.get_lead(lead_id)
+    assert lead["status"] == "contacted"
+    # Updating a missing lead returns None
+    assert crm.update_lead(lead_id + 1, update_data) is None
+
+def test_delete_lead(crm, lead_id):
+    """Test deleting a lead"""
+    assert crm.delete_lead(lead_id)
+    lead = crm.get_lead(lead_id)
+    assert lead is None
+    # Deleting it again reports that nothing was deleted
+    assert not crm.delete_lead(lead_id)
+
+def test_create_action(crm, lead_id):
+    """Test creating a new action"""
+    action_data = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Sent initial email"
+    }
+    # The stored action comes back from create_action
+    action = crm.create_action(action_data)
+    assert action["id"] is not None
+    assert action["lead_id"] == lead_id
+    assert action["action_type"] == "email"
+    assert action["details"] == "Sent initial email"
+
+def test_create_process(crm, lead_id):
+    """Test creating a new process"""
+    action_data = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Sent initial email"
+    }
+    action_id = crm.create_action(action_data)["id"]
+    process_data = {
+        "lead_id": lead_id,
+        "channel": "email",
+        "last_action_id": action_id,
+        "next_followup_datetime": "2023-10-01 10:00:00",
+        "status": "active"
+    }
+    # The stored process comes back from create_process
+    process = crm.create_process(process_data)
+    assert process["id"] is not None
+    assert process["lead_id"] == lead_id
+    assert process["channel"] == "email"
+    assert process["last_action_id"] == action_id
+    assert process["next_followup_datetime"] == "2023-10-01 10:00:00"
+    assert process["status"] == "active"
+
+def test_search_leads(crm):
+    """Test searching leads with filters"""
+    lead_data1 = {
+        "name": "Test Lead 1",
+        "email": "test1@example.com",
+        "status": "new"
+    }
+    lead_data2 = {
+        "name": "Test Lead 2",
+        "email": "test2@example.com",
+        "status": "contacted"
+    }
+    crm.create_lead(lead_data1)
+    crm.create_lead(lead_data2)
+    # Search for leads with status "new"
+    leads = crm.search_leads({"status": "new"})
+    assert len(leads) == 1
+    assert leads[0]["name"] == "Test Lead 1"
+
+def test_search_cache_invalidated_by_writes(crm):
+    """Test that cached search results never outlive a write"""
+    lead_id = crm.create_lead({"name": "Test Lead 1", "email": "test1@example.com"})["id"]
+    assert len(crm.search_leads({"status": "new"})) == 1
+
+    crm.create_lead({"name": "Test Lead 2", "email": "test2@example.com"})
+    assert len(crm.search_leads({"status": "new"})) == 2
+
+    crm.update_lead(lead_id, {"status": "contacted"})
+    assert len(crm.search_leads({"status": "new"})) == 1
+
+    crm.create_action({"lead_id": lead_id, "action_type": "email", "details": "Initial contact"})
+    assert len(crm.search_processes({"lead_id": lead_id})) == 1
+
+def test_search_cache_skips_rows_read_before_a_write(crm, monkeypatch):
+    """Test that a search overlapping a write does not cache the rows it read"""
+    lead_id = crm.create_lead({"name": "Test Lead", "email": "test@example.com"})["id"]
+    search = crm.db.search
+
+    def search_then_write(*args, **kwargs):
+        results = search(*args, **kwargs)
+        # Another writer commits after the rows were read but before they are cached
+        monkeypatch.setattr(crm.db, "search", search)
+        crm.update_lead(lead_id, {"status": "contacted"})
+        return results
+
+    monkeypatch.setattr(crm.db, "search", search_then_write)
+    assert len(crm.search_leads({"status": "new"})) == 1
+    assert crm.search_leads({"status": "new"}) == []
+
+def test_search_actions(crm, lead_id):
+    """Test searching actions with filters"""
+    action_data1 = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Sent initial email"
+    }
+    action_data2 = {
+        "lead_id": lead_id,
+        "action_type": "follow-up",
+        "details": "Sent follow-up email"
+    }
+    crm.create_action(action_data1)
+    crm.create_action(action_data2)
+    # Search for actions with action_type "email"
+    actions = crm.search_actions({"action_type": "email"})
+    assert len(actions) == 1
+    assert actions[0]["details"] == "Sent initial email"
+
+def test_search_processes(crm, lead_id):
+    """Test searching processes with filters"""
+    action_data = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Sent initial email"
+    }
+    action_id = crm.create_action(action_data)["id"]
+    # Do NOT manually create a process; it should be created by create_action
+    # Search for processes with status "active"
+    processes = crm.search_processes({"status": "active"})
+    assert len(processes) == 1
+    assert processes[0]["channel"] == "email"
+    assert processes[0]["lead_id"] == lead_id
+    assert processes[0]["last_action_id"] == action_id
+
+def test_only_one_process_per_lead(crm, lead_id):
+    """Test that there is only one process per lead, even after multiple actions"""
+    actions = crm.create_actions([
+        {"lead_id": lead_id, "action_type": "email", "details": "Initial contact"},
+        {"lead_id": lead_id, "action_type": "phone", "details": "Phone follow-up"},
+        {"lead_id": lead_id, "action_type": "meeting", "details": "In-person meeting"}
+    ])
+    assert [action["action_type"] for action in actions] == ["email", "phone", "meeting"]
+    # There should still be only one process for this lead, following the last action
+    processes = crm.search_processes({"lead_id": lead_id})
+    assert len(processes) == 1
+    assert processes[0]["last_action_id"] == actions[-1]["id"]
+    assert processes[0]["channel"] == "meeting"
+
+def test_new_lead_has_no_actions_or_process(crm, lead_id):
+    """Test that a new lead has no actions or process"""
+    # Check no actions exist
+    actions = crm.search_actions({"lead_id": lead_id})
+    assert len(actions) == 0
+    
+    # Check no process exists
+    processes = crm.search_processes({"lead_id": lead_id})
+    assert len(processes) == 0
+
+@freeze_time(FROZEN_TIME)
+def test_first_action_creates_process(crm, lead_id):
+    """Test that creating first action for a lead automatically creates a process"""
+    # Create first action
+    action_data = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Initial contact"
+    }
+    action_id = crm.create_action(action_data)["id"]
+    
+    # Verify process was created
+    processes = crm.search_processes({"lead_id": lead_id})
+    assert len(processes) == 1
+    process = processes[0]
+    
+    # Verify process details
+    assert process["lead_id"] == lead_id
+    assert process["last_action_id"] == action_id
+    assert process["channel"] == "email"
+    assert process["status"] == "active"
+    
+    # Verify next_followup_datetime is set to 7 days from now
+    assert process["next_followup_datetime"] == FOLLOWUP_TIME
+
+@freeze_time(FROZEN_TIME)
+def test_subsequent_action_updates_process(crm, lead_id):
+    """Test that creating subsequent actions updates the existing process"""
+    # Create first action
+    action_data1 = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Initial contact"
+    }
+    action_id1 = crm.create_action(action_data1)["id"]
+    
+    # Create second action
+    action_data2 = {
+        "lead_id": lead_id,
+        "action_type": "follow-up",
+        "details": "Follow-up contact"
+    }
+    action_id2 = crm.create_action(action_data2)["id"]
+    
+    # Verify process was updated
+    processes = crm.search_processes({"lead_id": lead_id})
+    assert len(processes) == 1
+    process = processes[0]
+    
+    # Verify process was updated with new action
+    assert process["last_action_id"] == action_id2
+    assert process["channel"] == "follow-up"
+    
+    # Verify next_followup_datetime is still 7 days from now
+    assert process["next_followup_datetime"] == FOLLOWUP_TIME
+
+def test_lead_with_url(crm):
+    """Test creating and managing a lead with URL field"""
+    # Create lead with URL
+    lead_data = {
+        "name": "Test Lead",
+        "email": "test@example.com",
+        "status": "new",
+        "url": "https://example.com/profile"
+    }
+    lead = crm.create_lead(lead_data)
+    lead_id = lead["id"]
+    
+    # Verify lead was created with URL
+    assert lead["name"] == "Test Lead"
+    assert lead["email"] == "test@example.com"
+    assert lead["url"] == "https://example.com/profile"
+    
+    # Test updating URL
+    update_data = {"url": "https://example.com/updated-profile"}
+    crm.update_lead(lead_id, update_data)
+    
+    # Verify URL was updated
+    updated_lead = crm.get_lead(lead_id)
+    assert updated_lead["url"] == "https://example.com/updated-profile"
+    
+    # Test searching by URL
+    search_results = crm.search_leads({"url": "https://example.com/updated-profile"})
+    assert len(search_results) == 1
+    assert search_results[0]["id"] == lead_id
+
+def test_lead_status_default_and_mandatory(crm):
+    """Test that lead status defaults to 'new' and is mandatory"""
+    # Test creating lead without status (should default to 'new')
+    lead_data = {
+        "name": "Test Lead",
+        "email": "test@example.com"
+    }
+    lead = crm.create_lead(lead_data)
+    assert lead["status"] == "new"
+
+    # Test that status cannot be set to None
+    with pytest.raises(ValueError):
+        crm.update_lead(lead["id"], {"status": None})
+
+def test_lead_duplicate_email(crm):
+    """Test that two leads cannot share an email"""
+    lead_id = crm.create_lead({"name": "Test Lead 1", "email": "test1@example.com"})["id"]
+    other_id = crm.create_lead({"name": "Test Lead 2", "email": "test2@example.com"})["id"]
+
+    with pytest.raises(ValueError):
+        crm.create_lead({"name": "Test Lead 3", "email": "test1@example.com"})
+    with pytest.raises(ValueError):
+        crm.update_lead(other_id, {"email": "test1@example.com"})
+
+    # Updating a lead with its own email is not a duplicate
+    crm.update_lead(lead_id, {"email": "test1@example.com", "name": "Renamed"})
+    assert crm.get_lead(lead_id)["name"] == "Renamed"
+
+def test_create_leads_bulk(crm):
+    """Test creating several leads at once, skipping duplicate emails"""
+    existing_id = crm.create_lead({"name": "Existing Lead", "email": "existing@example.com"})["id"]
+    created = crm.create_leads_bulk([
+        {"name": "Lead 1", "email": "Lead1@Example.com"},
+        {"name": "Existing Again", "email": "EXISTING@example.com"},
+        {"name": "Lead 2", "email": "lead2@example.com", "status": "contacted"},
+        {"name": "Lead 1 Again", "email": "lead1@example.com"}
+    ])
+    assert [lead["name"] for lead in created] == ["Lead 1", "Lead 2"]
+    assert [lead["email"] for lead in created] == ["lead1@example.com", "lead2@example.com"]
+    assert [lead["status"] for lead in created] == ["new", "contacted"]
+
+    # The existing lead is left untouched
+    assert crm.get_lead(existing_id)["name"] == "Existing Lead"
+    assert len(crm.search_leads()) == 3
+
+    # A batch of only known emails creates nothing
+    assert crm.create_leads_bulk([{"name": "Lead 2", "email": "lead2@example.com"}]) == []
+
+def test_create_leads_bulk_in_batches(crm, monkeypatch):
+    """Test that bulk creation stays under SQLite's bound parameter limit"""
+    crm.create_lead({"name": "Existing Lead", "email": "lead3@example.com"})
+    # As if SQLite were built to allow only four bound parameters per statement
+    limit = sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER
+    conn = crm.db.get_connection()
+    old_limit = conn.setlimit(limit, 4)
+    monkeypatch.setattr(crm.db, "max_variables", 4)
+    try:
+        created = crm.create_leads_bulk([{"name": f"Lead {i}", "email": f"lead{i}@example.com"}
+                                         for i in range(1, 6)])
+    finally:
+        conn.setlimit(limit, old_limit)
+    assert [lead["email"] for lead in created] == [
+        "lead1@example.com", "lead2@example.com", "lead4@example.com", "lead5@example.com"]
+    assert len(crm.search_leads()) == 5
+
+def test_action_timestamp(crm, lead_id):
+    """Test that actions have a timestamp field"""
+    # Create action
+    action_data = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Initial contact"
+    }
+    action_id = crm.create_action(action_data)["id"]
+
+    # Verify action has timestamp
+    action = crm.get_action(action_id)
+    assert "timestamp" in action
+    assert action["timestamp"] is not None
+
+@freeze_time(FROZEN_TIME)
+def test_process_followup_datetime(crm, lead_id):
+    """Test that process followup datetime is set to 7 days after last action"""
+    # Create first action
+    action_data = {
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Initial contact"
+    }
+    action = crm.create_action(action_data)
+
+    # Get the process that was created
+    processes = crm.search_processes({"lead_id": lead_id})
+    assert len(processes) == 1
+    process = processes[0]
+
+    # Verify followup datetime is set 7 days after the action's timestamp
+    assert action["timestamp"] == FROZEN_TIME
+    assert process["next_followup_datetime"] == FOLLOWUP_TIME
+
+def test_unique_process_index_replaces_old_index(shared_tmp, caplog):
+    """Test that a database with the old non-unique process index is migrated on open"""
+    db_path = str(shared_tmp / "old_process_index.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE processes (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, lead_id INTEGER,
+                                channel TEXT, last_action_id INTEGER, next_followup_datetime TEXT,
+                                status TEXT);
+        CREATE INDEX idx_processes_lead_id ON processes (lead_id);
+        -- As the old code wrote them: create_action made each lead's first
+        -- process and kept updating it, and create_process could add more
+        INSERT INTO processes (lead_id, channel, last_action_id, next_followup_datetime, status)
+        VALUES (1, 'phone', 2, '2024-01-08 12:00:00', 'active'),
+               (2, 'email', 3, '2024-01-08 12:00:00', 'active'),
+               (1, 'email', NULL, NULL, 'new');
+    """)
+    conn.close()
+
+    with caplog.at_level(logging.WARNING, logger="crm.crm"):
+        crm = CRM(db_path)
+    try:
+        # Each lead keeps the process its actions were updating
+        assert [(p["id"], p["lead_id"], p["last_action_id"]) for p in crm.search_processes()] == [
+            (1, 1, 2), (2, 2, 3)]
+        assert "Deleted 1 duplicate processes" in caplog.text
+        lead_id = crm.create_lead({"name": "Test Lead", "email": "test@example.com"})["id"]
+        action_id = crm.create_action({"lead_id": lead_id, "action_type": "email"})["id"]
+        assert crm.search_processes({"lead_id": lead_id})[0]["last_action_id"] == action_id
+    finally:
+        crm.close()
+
+def test_unique_email_index_names_duplicate_emails(shared_tmp):
+    """Test that opening a database whose leads share emails fails and names them"""
+    db_path = str(shared_tmp / "duplicate_emails.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE leads (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, email TEXT,
+                            status TEXT NOT NULL DEFAULT 'new', url TEXT);
+        INSERT INTO leads (name, email) VALUES ('A', 'a@example.com'), ('B', 'b@example.com'),
+                                               ('A again', 'a@example.com');
+    """)
+    conn.close()
+
+    with pytest.raises(RuntimeError, match="a@example.com") as error:
+        CRM(db_path)
+    assert "b@example.com" not in str(error.value)
+
+    # Once the duplicate is resolved the database opens normally
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM leads WHERE name = 'A again'")
+    conn.commit()
+    conn.close()
+    crm = CRM(db_path)
+    try:
+        with pytest.raises(ValueError):
+            crm.create_lead({"name": "A twice", "email": "a@example.com"})
+    finally:
+        crm.close()
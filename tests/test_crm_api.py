@@ -1,320 +1,316 @@
-import unittest
-from fastapi.testclient import TestClient
-from crm.api import create_app_with_db
-import os
-import sys
-import tempfile
-
-class TestCRMAPI(unittest.TestCase):
-    def setUp(self):
-        # Create a unique temporary database file for each test
-        self.temp_dir = tempfile.mkdtemp()
-        self.db_path = os.path.join(self.temp_dir, "test_api.db")
-        # Patch the app to use this db_path
-        from crm.api import create_app_with_db
-        self.app = create_app_with_db(self.db_path)
-        global client
-        client = TestClient(self.app)
-
-    def tearDown(self):
-        # Clean up the temporary database file and directory
-        try:
-            if os.path.exists(self.db_path):
-                os.remove(self.db_path)
-            if os.path.exists(self.temp_dir):
-                os.rmdir(self.temp_dir)
-        except Exception:
+import json
+import pytest
+from datetime import datetime, timedelta
+from crm.api import create_app, create_app_with_db
+
+# Every test runs on the session event loop that the shared client is bound to
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+# Processes follow up this long after their last action
+SEVEN_DAYS = timedelta(days=7)
+
+# The lead most tests post, serialized once instead of on every request
+LEAD_BODY = json.dumps({"name": "Test Lead", "email": "test@example.com", "status": "new"}).encode()
+JSON_HEADERS = {"content-type": "application/json"}
+
+async def test_create_lead(client):
+    response = await client.post("/leads/", content=LEAD_BODY, headers=JSON_HEADERS)
+    assert response.status_code == 200
+    assert "id" in response.json()
+
+async def test_get_lead(client):
+    # First create a lead
+    create_response = await client.post("/leads/", content=LEAD_BODY, headers=JSON_HEADERS)
+    lead_id = create_response.json()["id"]
+
+    # Now get the lead
+    response = await client.get(f"/leads/{lead_id}")
+    assert response.status_code == 200
+    assert response.json()["name"] == "Test Lead"
+
+async def test_get_lead_etag(client):
+    create_response = await client.post("/leads/", content=LEAD_BODY, headers=JSON_HEADERS)
+    lead_id = create_response.json()["id"]
+
+    response = await client.get(f"/leads/{lead_id}")
+    etag = response.headers["etag"]
+
+    # A matching If-None-Match gets an empty 304
+    cached_response = await client.get(f"/leads/{lead_id}", headers={"If-None-Match": etag})
+    assert cached_response.status_code == 304
+    assert cached_response.headers["etag"] == etag
+    assert cached_response.content == b""
+
+    # After an update the old ETag no longer matches
+    await client.put(f"/leads/{lead_id}", json={"name": "Updated Lead", "email": "test@example.com"})
+    updated_response = await client.get(f"/leads/{lead_id}", headers={"If-None-Match": etag})
+    assert updated_response.status_code == 200
+    assert updated_response.headers["etag"] != etag
+    assert updated_response.json()["name"] == "Updated Lead"
+
+async def test_update_lead(client):
+    # First create a lead
+    create_response = await client.post("/leads/", content=LEAD_BODY, headers=JSON_HEADERS)
+    lead_id = create_response.json()["id"]
+
+    # Now update the lead
+    response = await client.put(f"/leads/{lead_id}", json={"name": "Updated Lead", "email": "updated@example.com", "status": "contacted"})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Updated Lead"
+
+async def test_delete_lead(client):
+    # First create a lead
+    create_response = await client.post("/leads/", content=LEAD_BODY, headers=JSON_HEADERS)
+    lead_id = create_response.json()["id"]
+
+    # Now delete the lead
+    response = await client.delete(f"/leads/{lead_id}")
+    assert response.status_code == 200
+    assert response.json()["message"] == "Lead deleted"
+
+async def test_update_and_delete_missing_lead(client):
+    response = await client.put("/leads/999", json={"name": "Missing Lead", "email": "missing@example.com"})
+    assert response.status_code == 404
+    response = await client.delete("/leads/999")
+    assert response.status_code == 404
+
+async def test_search_leads(client):
+    # First create a lead
+    await client.post("/leads/", content=LEAD_BODY, headers=JSON_HEADERS)
+
+    # Now search for leads
+    response = await client.get("/leads/", params={"status": "new"})
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+
+async def test_create_leads_bulk(client):
+    await client.post("/leads/", json={"name": "Existing Lead", "email": "existing@example.com"})
+
+    response = await client.post("/leads/bulk", json=[
+        {"name": "Lead 1", "email": "lead1@example.com"},
+        {"name": "Existing Again", "email": "EXISTING@EXAMPLE.COM"},
+        {"name": "Lead 2", "email": "LEAD2@example.com", "status": "contacted"}
+    ])
+    assert response.status_code == 200
+    created = response.json()
+    assert [lead["email"] for lead in created] == ["lead1@example.com", "lead2@example.com"]
+    assert all("id" in lead for lead in created)
+
+    # Invalid emails reject the whole batch
+    invalid_response = await client.post("/leads/bulk", json=[{"name": "Lead 3", "email": "invalid-email"}])
+    assert invalid_response.status_code == 422
+
+async def test_create_action(client, lead_id):
+    response = await client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Send welcome email"})
+    assert response.status_code == 200
+    assert "id" in response.json()
+
+async def test_get_action(client, lead_id):
+    # First create an action
+    create_response = await client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Send welcome email"})
+    action_id = create_response.json()["id"]
+
+    # Now get the action
+    response = await client.get(f"/actions/{action_id}")
+    assert response.status_code == 200
+    assert response.json()["action_type"] == "email"
+
+async def test_search_actions(client, lead_id):
+    # First create an action
+    await client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Send welcome email"})
+
+    # Now search for actions
+    response = await client.get("/actions/", params={"action_type": "email"})
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+
+async def test_create_process(client, lead_id):
+    # Create an action which should automatically create a process
+    action_response = await client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Initial action"})
+    assert action_response.status_code == 200
+    
+    # Verify that a process was created automatically
+    processes = (await client.get("/processes/")).json()
+    assert len(processes) == 1
+    process = processes[0]
+    assert process["lead_id"] == lead_id
+    assert process["channel"] == "email"
+    assert process["status"] == "active"
+
+async def test_get_process(client, lead_id):
+    action_response = await client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Initial action"})
+    
+    # Get the automatically created process
+    processes = (await client.get("/processes/")).json()
+    assert len(processes) == 1
+    process_id = processes[0]["id"]
+
+    # Now get the process
+    response = await client.get(f"/processes/{process_id}")
+    assert response.status_code == 200
+    assert response.json()["lead_id"] == lead_id
+    assert response.json()["channel"] == "email"
+    assert response.json()["status"] == "active"
+
+async def test_search_processes(client, lead_id):
+    await client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Initial action"})
+
+    # Now search for processes
+    response = await client.get("/processes/", params={"status": "active"})
+    assert response.status_code == 200
+    processes = response.json()
+    assert isinstance(processes, list)
+    assert len(processes) == 1
+    assert processes[0]["lead_id"] == lead_id
+    assert processes[0]["status"] == "active"
+
+async def test_lead_with_url(client):
+    """Test creating and managing a lead with URL field through the API"""
+    # Create lead with URL
+    create_response = await client.post("/leads/", json={
+        "name": "Test Lead",
+        "email": "test@example.com",
+        "status": "new",
+        "url": "https://example.com/profile"
+    })
+    assert create_response.status_code == 200
+    lead_id = create_response.json()["id"]
+    
+    # Verify lead was created with URL
+    get_response = await client.get(f"/leads/{lead_id}")
+    assert get_response.status_code == 200
+    assert get_response.json()["url"] == "https://example.com/profile"
+    
+    # Test updating URL
+    update_response = await client.put(f"/leads/{lead_id}", json={
+        "name": "Test Lead",
+        "email": "test@example.com",
+        "status": "new",
+        "url": "https://example.com/updated-profile"
+    })
+    assert update_response.status_code == 200
+    assert update_response.json()["url"] == "https://example.com/updated-profile"
+    
+    # Test searching by URL
+    search_response = await client.get("/leads/", params={"url": "https://example.com/updated-profile"})
+    assert search_response.status_code == 200
+    results = search_response.json()
+    assert len(results) == 1
+    assert results[0]["id"] == lead_id
+
+async def test_lead_status_default_and_mandatory(client):
+    """Test that lead status defaults to 'new' and is mandatory through the API"""
+    # Test creating lead without status (should default to 'new')
+    create_response = await client.post("/leads/", json={
+        "name": "Test Lead",
+        "email": "test@example.com"
+    })
+    assert create_response.status_code == 200
+    lead_id = create_response.json()["id"]
+
+    # Verify status defaulted to 'new'
+    get_response = await client.get(f"/leads/{lead_id}")
+    assert get_response.status_code == 200
+    assert get_response.json()["status"] == "new"
+
+    # Test that status cannot be set to None (FastAPI returns 422 for invalid request body)
+    update_response = await client.put(f"/leads/{lead_id}", json={
+        "name": "Test Lead",
+        "email": "test@example.com",
+        "status": None
+    })
+    assert update_response.status_code == 422
+
+async def test_action_timestamp(client, lead_id):
+    """Test that actions have a timestamp field through the API"""
+    # Create action
+    action_response = await client.post("/actions/", json={
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Initial contact"
+    })
+    assert action_response.status_code == 200
+    action_id = action_response.json()["id"]
+
+    # Verify action has timestamp
+    get_response = await client.get(f"/actions/{action_id}")
+    assert get_response.status_code == 200
+    action = get_response.json()
+    assert "timestamp" in action
+    assert action["timestamp"] is not None
+
+async def test_process_followup_datetime(client, lead_id):
+    """Test that process followup datetime is set to 7 days after last action through the API"""
+    # Create action
+    action_response = await client.post("/actions/", json={
+        "lead_id": lead_id,
+        "action_type": "email",
+        "details": "Initial contact"
+    })
+    # The created action carries the timestamp it was stored with
+    action_timestamp = action_response.json()["timestamp"]
+
+    # Get the process that was created
+    process_response = await client.get("/processes/", params={"lead_id": lead_id})
+    assert process_response.status_code == 200
+    processes = process_response.json()
+    assert len(processes) == 1
+    process = processes[0]
+
+    # Calculate expected followup datetime (7 days after action timestamp)
+    expected_followup = datetime.strptime(action_timestamp, "%Y-%m-%d %H:%M:%S") + SEVEN_DAYS
+    actual_followup = datetime.strptime(process["next_followup_datetime"], "%Y-%m-%d %H:%M:%S")
+
+    # Verify followup datetime is set correctly
+    assert actual_followup == expected_followup
+
+@pytest.mark.parametrize("email_in,expected_email,http_status", [
+    ("TEST@EXAMPLE.COM", "test@example.com", 200),
+    ("Test@Example.com", "test@example.com", 200),
+    ("invalid-email", None, 422),
+    ("test@", None, 422)
+])
+async def test_lead_email_validation(client, email_in, expected_email, http_status):
+    """Test that emails are validated and stored lowercase"""
+    create_response = await client.post("/leads/", json={"name": "Test Lead", "email": email_in})
+    assert create_response.status_code == http_status
+    if expected_email is not None:
+        assert create_response.json()["email"] == expected_email
+
+@pytest.mark.parametrize("duplicate_email", ["test@example.com", "TEST@EXAMPLE.COM", "Test@Example.com"])
+async def test_lead_duplicate_prevention(client, lead_id, duplicate_email):
+    """Test that duplicate leads (same email, in any case) are not allowed"""
+    # lead_id already uses test@example.com
+    duplicate_response = await client.post("/leads/", json={"name": "Test Lead 2", "email": duplicate_email})
+    assert duplicate_response.status_code == 400
+    assert "email already exists" in duplicate_response.json()["detail"].lower()
+
+    # A different email is accepted, but cannot then be changed to the taken one
+    different_response = await client.post("/leads/", json={"name": "Test Lead 3", "email": "different@example.com"})
+    assert different_response.status_code == 200
+    update_response = await client.put(f"/leads/{different_response.json()['id']}", json={
+        "name": "Test Lead 3",
+        "email": duplicate_email
+    })
+    assert update_response.status_code == 400
+    assert "email already exists" in update_response.json()["detail"].lower()
+
+async def test_lifespan_reopens_its_crm():
+    """Test that an app can be started again after shutting down"""
+    app = create_app(":memory:")
+    for _ in range(2):
+        async with app.router.lifespan_context(app):
+            assert app.state.crm.create_lead({"name": "Test Lead", "email": "test@example.com"})["id"] == 1
+        assert app.state.crm is None
+
+async def test_lifespan_leaves_callers_crm_open():
+    """Test that shutdown does not close a CRM opened by create_app_with_db"""
+    app = create_app_with_db(":memory:")
+    crm = app.state.crm
+    try:
+        async with app.router.lifespan_context(app):
             pass
-
-    def test_create_lead(self):
-        response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        self.assertEqual(response.status_code, 200)
-        self.assertIn("id", response.json())
-
-    def test_get_lead(self):
-        # First create a lead
-        create_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = create_response.json()["id"]
-
-        # Now get the lead
-        response = client.get(f"/leads/{lead_id}")
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()["name"], "Test Lead")
-
-    def test_update_lead(self):
-        # First create a lead
-        create_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = create_response.json()["id"]
-
-        # Now update the lead
-        response = client.put(f"/leads/{lead_id}", json={"name": "Updated Lead", "email": "updated@example.com", "status": "contacted"})
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()["name"], "Updated Lead")
-
-    def test_delete_lead(self):
-        # First create a lead
-        create_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = create_response.json()["id"]
-
-        # Now delete the lead
-        response = client.delete(f"/leads/{lead_id}")
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()["message"], "Lead deleted")
-
-    def test_search_leads(self):
-        # First create a lead
-        client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-
-        # Now search for leads
-        response = client.get("/leads/", params={"status": "new"})
-        self.assertEqual(response.status_code, 200)
-        self.assertIsInstance(response.json(), list)
-
-    def test_create_action(self):
-        # Create a lead first
-        lead_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = lead_response.json()["id"]
-        response = client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Send welcome email"})
-        self.assertEqual(response.status_code, 200)
-        self.assertIn("id", response.json())
-
-    def test_get_action(self):
-        # First create a lead and an action
-        lead_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = lead_response.json()["id"]
-        create_response = client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Send welcome email"})
-        action_id = create_response.json()["id"]
-
-        # Now get the action
-        response = client.get(f"/actions/{action_id}")
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()["action_type"], "email")
-
-    def test_search_actions(self):
-        # First create a lead and an action
-        lead_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = lead_response.json()["id"]
-        client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Send welcome email"})
-
-        # Now search for actions
-        response = client.get("/actions/", params={"action_type": "email"})
-        self.assertEqual(response.status_code, 200)
-        self.assertIsInstance(response.json(), list)
-
-    def test_create_process(self):
-        # Create a lead first
-        lead_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = lead_response.json()["id"]
-        
-        # Create an action which should automatically create a process
-        action_response = client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Initial action"})
-        self.assertEqual(action_response.status_code, 200)
-        
-        # Verify that a process was created automatically
-        processes = client.get("/processes/").json()
-        self.assertEqual(len(processes), 1)
-        process = processes[0]
-        self.assertEqual(process["lead_id"], lead_id)
-        self.assertEqual(process["channel"], "email")
-        self.assertEqual(process["status"], "active")
-
-    def test_get_process(self):
-        # Create a lead and an action first
-        lead_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = lead_response.json()["id"]
-        action_response = client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Initial action"})
-        
-        # Get the automatically created process
-        processes = client.get("/processes/").json()
-        self.assertEqual(len(processes), 1)
-        process_id = processes[0]["id"]
-
-        # Now get the process
-        response = client.get(f"/processes/{process_id}")
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()["lead_id"], lead_id)
-        self.assertEqual(response.json()["channel"], "email")
-        self.assertEqual(response.json()["status"], "active")
-
-    def test_search_processes(self):
-        # Create a lead and an action first
-        lead_response = client.post("/leads/", json={"name": "Test Lead", "email": "test@example.com", "status": "new"})
-        lead_id = lead_response.json()["id"]
-        client.post("/actions/", json={"lead_id": lead_id, "action_type": "email", "description": "Initial action"})
-
-        # Now search for processes
-        response = client.get("/processes/", params={"status": "active"})
-        self.assertEqual(response.status_code, 200)
-        processes = response.json()
-        self.assertIsInstance(processes, list)
-        self.assertEqual(len(processes), 1)
-        self.assertEqual(processes[0]["lead_id"], lead_id)
-        self.assertEqual(processes[0]["status"], "active")
-
-    def test_lead_with_url(self):
-        """Test creating and managing a lead with URL field through the API"""
-        # Create lead with URL
-        create_response = client.post("/leads/", json={
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new",
-            "url": "https://example.com/profile"
-        })
-        self.assertEqual(create_response.status_code, 200)
-        lead_id = create_response.json()["id"]
-        
-        # Verify lead was created with URL
-        get_response = client.get(f"/leads/{lead_id}")
-        self.assertEqual(get_response.status_code, 200)
-        self.assertEqual(get_response.json()["url"], "https://example.com/profile")
-        
-        # Test updating URL
-        update_response = client.put(f"/leads/{lead_id}", json={
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": "new",
-            "url": "https://example.com/updated-profile"
-        })
-        self.assertEqual(update_response.status_code, 200)
-        self.assertEqual(update_response.json()["url"], "https://example.com/updated-profile")
-        
-        # Test searching by URL
-        search_response = client.get("/leads/", params={"url": "https://example.com/updated-profile"})
-        self.assertEqual(search_response.status_code, 200)
-        results = search_response.json()
-        self.assertEqual(len(results), 1)
-        self.assertEqual(results[0]["id"], lead_id)
-
-    def test_lead_status_default_and_mandatory(self):
-        """Test that lead status defaults to 'new' and is mandatory through the API"""
-        # Test creating lead without status (should default to 'new')
-        create_response = client.post("/leads/", json={
-            "name": "Test Lead",
-            "email": "test@example.com"
-        })
-        self.assertEqual(create_response.status_code, 200)
-        lead_id = create_response.json()["id"]
-
-        # Verify status defaulted to 'new'
-        get_response = client.get(f"/leads/{lead_id}")
-        self.assertEqual(get_response.status_code, 200)
-        self.assertEqual(get_response.json()["status"], "new")
-
-        # Test that status cannot be set to None (FastAPI returns 422 for invalid request body)
-        update_response = client.put(f"/leads/{lead_id}", json={
-            "name": "Test Lead",
-            "email": "test@example.com",
-            "status": None
-        })
-        self.assertEqual(update_response.status_code, 422)
-
-    def test_action_timestamp(self):
-        """Test that actions have a timestamp field through the API"""
-        # Create lead
-        lead_response = client.post("/leads/", json={
-            "name": "Test Lead",
-            "email": "test@example.com"
-        })
-        lead_id = lead_response.json()["id"]
-
-        # Create action
-        action_response = client.post("/actions/", json={
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Initial contact"
-        })
-        self.assertEqual(action_response.status_code, 200)
-        action_id = action_response.json()["id"]
-
-        # Verify action has timestamp
-        get_response = client.get(f"/actions/{action_id}")
-        self.assertEqual(get_response.status_code, 200)
-        action = get_response.json()
-        self.assertIn("timestamp", action)
-        self.assertIsNotNone(action["timestamp"])
-
-    def test_process_followup_datetime(self):
-        """Test that process followup datetime is set to 7 days after last action through the API"""
-        # Create lead
-        lead_response = client.post("/leads/", json={
-            "name": "Test Lead",
-            "email": "test@example.com"
-        })
-        lead_id = lead_response.json()["id"]
-
-        # Create action
-        action_response = client.post("/actions/", json={
-            "lead_id": lead_id,
-            "action_type": "email",
-            "details": "Initial contact"
-        })
-        action_id = action_response.json()["id"]
-
-        # Get the process that was created
-        process_response = client.get("/processes/", params={"lead_id": lead_id})
-        self.assertEqual(process_response.status_code, 200)
-        processes = process_response.json()
-        self.assertEqual(len(processes), 1)
-        process = processes[0]
-
-        # Get the action to check its timestamp
-        action_response = client.get(f"/actions/{action_id}")
-        action = action_response.json()
-        action_timestamp = action["timestamp"]
-
-        # Calculate expected followup datetime (7 days after action timestamp)
-        from datetime import datetime, timedelta
-        expected_followup = datetime.strptime(action_timestamp, "%Y-%m-%d %H:%M:%S") + timedelta(days=7)
-        actual_followup = datetime.strptime(process["next_followup_datetime"], "%Y-%m-%d %H:%M:%S")
-
-        # Verify followup datetime is set correctly
-        self.assertEqual(actual_followup, expected_followup)
-
-    def test_lead_email_validation(self):
-        """Test email validation and formatting"""
-        # Test creating lead with uppercase email (should be converted to lowercase)
-        create_response = client.post("/leads/", json={
-            "name": "Test Lead",
-            "email": "TEST@EXAMPLE.COM"
-        })
-        self.assertEqual(create_response.status_code, 200)
-        lead_id = create_response.json()["id"]
-
-        # Verify email was converted to lowercase
-        get_response = client.get(f"/leads/{lead_id}")
-        self.assertEqual(get_response.status_code, 200)
-        self.assertEqual(get_response.json()["email"], "test@example.com")
-
-        # Test creating lead with invalid email format
-        invalid_response = client.post("/leads/", json={
-            "name": "Test Lead",
-            "email": "invalid-email"
-        })
-        self.assertEqual(invalid_response.status_code, 422)
-
-    def test_lead_duplicate_prevention(self):
-        """Test that duplicate leads (same email) are not allowed"""
-        # Create first lead
-        create_response = client.post("/leads/", json={
-            "name": "Test Lead 1",
-            "email": "test@example.com"
-        })
-        self.assertEqual(create_response.status_code, 200)
-
-        # Try to create second lead with same email (case insensitive)
-        duplicate_response = client.post("/leads/", json={
-            "name": "Test Lead 2",
-            "email": "TEST@EXAMPLE.COM"
-        })
-        self.assertEqual(duplicate_response.status_code, 400)
-        self.assertIn("email already exists", duplicate_response.json()["detail"].lower())
-
-        # Try to create lead with different email (should succeed)
-        different_response = client.post("/leads/", json={
-            "name": "Test Lead 3",
-            "email": "different@example.com"
-        })
-        self.assertEqual(different_response.status_code, 200)
-
-if __name__ == "__main__":
-    unittest.main() 
\ No newline at end of file
+        assert app.state.crm is crm
+        assert crm.get_lead(1) is None
+    finally:
+        crm.close()
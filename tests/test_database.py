@@ -1,281 +1,384 @@
-import unittest
-import os
-import tempfile
+import logging
+import uuid
+import pytest
 from crm.database import Database
-import time
+from datetime import datetime, timedelta
 import sqlite3
 
-class TestDatabase(unittest.TestCase):
-    def setUp(self):
-        # Create a temporary database file for testing
-        self.temp_dir = tempfile.mkdtemp()
-        self.db_path = os.path.join(self.temp_dir, 'test.db')
-        self.db = Database(self.db_path)
-
-    def tearDown(self):
-        """Clean up after each test"""
-        # Close the database connection
-        self.db.close()
-        
-        # Wait a moment for the connection to fully close
-        time.sleep(0.1)
-        
-        # Try to remove the test database file
-        try:
-            if os.path.exists(self.db_path):
-                os.remove(self.db_path)
-        except PermissionError:
-            # If we can't remove it now, it will be cleaned up later
-            pass
-
-    def test_create_collection(self):
-        """Test creating a new collection (table)"""
-        collection_name = "leads"
-        columns = {
-            "id": "INTEGER PRIMARY KEY",
-            "email": "TEXT NOT NULL",
-            "name": "TEXT",
-            "status": "TEXT DEFAULT 'new'"
-        }
-        self.db.create_collection(collection_name, columns)
-        
-        # Verify collection exists
-        result = self.db.execute_query(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{collection_name}'")
-        print(f"[DEBUG] test_create_collection result: {result}")
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]['name'], collection_name)
-
-    def test_insert_and_get(self):
-        """Test inserting and retrieving data"""
-        # Create test collection
-        self.db.create_collection("leads", {
-            "id": "INTEGER PRIMARY KEY",
-            "email": "TEXT NOT NULL",
-            "name": "TEXT"
-        })
-
-        # Insert test data
-        data = {"email": "test@example.com", "name": "Test User"}
-        self.db.insert("leads", data)
-
-        # Retrieve and verify
-        result = self.db.get("leads", {"email": "test@example.com"})
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]["email"], "test@example.com")
-        self.assertEqual(result[0]["name"], "Test User")
-
-    def test_update(self):
-        """Test updating existing records"""
-        # Create and populate test collection
-        self.db.create_collection("leads", {
-            "id": "INTEGER PRIMARY KEY",
-            "email": "TEXT NOT NULL",
-            "name": "TEXT"
-        })
-        self.db.insert("leads", {"email": "test@example.com", "name": "Test User"})
-
-        # Update record
-        self.db.update("leads", 
-                      {"name": "Updated Name"}, 
-                      {"email": "test@example.com"})
-
-        # Verify update
-        result = self.db.get("leads", {"email": "test@example.com"})
-        self.assertEqual(result[0]["name"], "Updated Name")
-
-    def test_delete(self):
-        """Test deleting records"""
-        # Create and populate test collection
-        self.db.create_collection("leads", {
-            "id": "INTEGER PRIMARY KEY",
-            "email": "TEXT NOT NULL",
-            "name": "TEXT"
-        })
-        self.db.insert("leads", {"email": "test@example.com", "name": "Test User"})
-
-        # Delete record
-        self.db.delete("leads", {"email": "test@example.com"})
-
-        # Verify deletion
-        result = self.db.get("leads", {"email": "test@example.com"})
-        self.assertEqual(len(result), 0)
-
-    def test_add_column(self):
-        """Test adding a new column to an existing collection (single connection version)"""
-        print(f"[DEBUG] DB path before create_collection: {self.db_path}")
-        print(f"[DEBUG] Files in temp dir before create_collection: {os.listdir(self.temp_dir)}")
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        # Drop the table if it exists to ensure a fresh schema
-        cursor.execute("DROP TABLE IF EXISTS leads")
-        # Create initial collection
-        cursor.execute("CREATE TABLE leads (id INTEGER PRIMARY KEY, email TEXT NOT NULL)")
-        conn.commit()
-
-        # Check if table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        result = cursor.fetchall()
-        print(f"[DEBUG] Tables in DB after create_collection: {result}")
-
-        # Insert a dummy row to force schema flush
-        cursor.execute("INSERT INTO leads (email) VALUES (?)", ("dummy@example.com",))
-        conn.commit()
-
-        print(f"[DEBUG] DB path before add_column: {self.db_path}")
-        print(f"[DEBUG] Files in temp dir before add_column: {os.listdir(self.temp_dir)}")
-        # Add new column
-        cursor.execute("ALTER TABLE leads ADD COLUMN status TEXT DEFAULT 'new'")
-        conn.commit()
-
-        print(f"[DEBUG] DB path after add_column: {self.db_path}")
-        print(f"[DEBUG] Files in temp dir after add_column: {os.listdir(self.temp_dir)}")
-        # Verify column was added
-        cursor.execute("PRAGMA table_info(leads)")
-        result = cursor.fetchall()
-        print(f"[DEBUG] test_add_column PRAGMA result: {result}")
-        columns = [row[1] for row in result]
+# File-backed test databases need no durability, so skip the journal file
+# and fsyncs; in-memory databases have neither and keep the defaults
+TEST_PRAGMAS = {"journal_mode": "MEMORY", "synchronous": "OFF", "temp_store": "MEMORY",
+                "locking_mode": "EXCLUSIVE"}
+
+# The format SQLite's CURRENT_TIMESTAMP writes
+_TS_FMT = "%Y-%m-%d %H:%M:%S"
+
+# Constant SQL, so every check reuses the connection's cached statement
+_TABLE_EXISTS = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
+
+# Tables shared by the tests using the db fixture; created once per module and
+# rolled back to empty after each test so no test pays for DDL
+_SCHEMA_SCRIPT = """
+CREATE TABLE leads (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL DEFAULT 'new',
+    url TEXT,
+    score INTEGER
+);
+CREATE TABLE actions (
+    id INTEGER PRIMARY KEY,
+    lead_id INTEGER NOT NULL,
+    action_type TEXT,
+    details TEXT,
+    timestamp TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE processes (
+    id INTEGER PRIMARY KEY,
+    lead_id INTEGER NOT NULL,
+    channel TEXT,
+    last_action_id INTEGER,
+    next_followup_datetime TEXT,
+    status TEXT
+);
+CREATE UNIQUE INDEX idx_processes_lead_id ON processes (lead_id);
+"""
+
+@pytest.fixture(scope="module")
+def shared_db():
+    """One in-memory database for the module, with the shared tables created once"""
+    db = Database(":memory:")
+    # The whole schema in one call, committed together
+    db.get_connection().executescript(f"BEGIN;{_SCHEMA_SCRIPT}COMMIT;")
+    yield db
+    db.close()
+
+@pytest.fixture
+def db(shared_db):
+    """The module database, with everything a test writes rolled back afterwards"""
+    conn = shared_db.get_connection()
+    conn.execute("SAVEPOINT test_sp")
+    yield shared_db
+    conn.execute("ROLLBACK TO SAVEPOINT test_sp")
+    conn.execute("RELEASE SAVEPOINT test_sp")
+
+@pytest.fixture(scope="module")
+def _schema_db():
+    db = Database(":memory:")
+    yield db
+    db.close()
+
+@pytest.fixture
+def schema_db(_schema_db):
+    """A database with no tables, for tests that create or alter them"""
+    tables = _schema_db.execute_query(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+    for table in tables:
+        _schema_db.execute_query(f"DROP TABLE IF EXISTS {table['name']}")
+    return _schema_db
+
+@pytest.fixture
+def db_path(shared_tmp):
+    """A fresh file path for tests that need a file-backed database of their own"""
+    # The session's directory is removed by pytest
+    return str(shared_tmp / f"test_{uuid.uuid4().hex}.db")
+
+def test_connection_pragmas(db_path):
+    """Test that performance pragmas are applied when the connection opens"""
+    db = Database(db_path)
+    try:
+        assert db.execute_query("PRAGMA journal_mode")[0]["journal_mode"] == "wal"
+        # synchronous=NORMAL is reported as 1
+        assert db.execute_query("PRAGMA synchronous")[0]["synchronous"] == 1
+        assert db.execute_query("PRAGMA foreign_keys")[0]["foreign_keys"] == 1
+        assert db.execute_query("PRAGMA trusted_schema")[0]["trusted_schema"] == 0
+    finally:
+        db.close()
+
+def test_connection_pragma_overrides(db_path):
+    """Test that pragmas passed to Database replace the defaults and keep the rest"""
+    db = Database(db_path, TEST_PRAGMAS)
+    try:
+        # A file database would otherwise report wal and synchronous=NORMAL (1)
+        assert db.execute_query("PRAGMA journal_mode")[0]["journal_mode"] == "memory"
+        assert db.execute_query("PRAGMA synchronous")[0]["synchronous"] == 0
+        assert db.execute_query("PRAGMA foreign_keys")[0]["foreign_keys"] == 1
+    finally:
+        db.close()
+
+def test_shared_memory_uri():
+    """Test that connections to the same shared-cache URI see the same in-memory database"""
+    uri = "file:test_shared_memory_uri?mode=memory&cache=shared"
+    # Two Databases would share one pooled connection, so open the second raw
+    db, conn = Database(uri), sqlite3.connect(uri, uri=True)
+    try:
+        db.create_collection("leads", {"id": "INTEGER PRIMARY KEY", "email": "TEXT"})
+        db.insert("leads", {"email": "test@example.com"})
+        assert conn.execute("SELECT email FROM leads").fetchall() == [("test@example.com",)]
+    finally:
         conn.close()
-        self.assertIn("status", columns)
-
-    def test_filter_query(self):
-        """Test filtering records with complex conditions"""
-        # Create and populate test collection
-        self.db.create_collection("leads", {
-            "id": "INTEGER PRIMARY KEY",
-            "email": "TEXT NOT NULL",
-            "status": "TEXT",
-            "score": "INTEGER"
-        })
-
-        # Insert test data
-        test_data = [
-            {"email": "test1@example.com", "status": "new", "score": 80},
-            {"email": "test2@example.com", "status": "contacted", "score": 60},
-            {"email": "test3@example.com", "status": "new", "score": 90}
-        ]
-        for data in test_data:
-            self.db.insert("leads", data)
-
-        # Test complex filter
-        result = self.db.get("leads", 
-                           {"status": "new", "score": (">", 85)},
-                           order_by="score DESC")
-        
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]["email"], "test3@example.com")
-
-    def test_lead_with_url(self):
-        """Test creating and retrieving a lead with URL field"""
-        # Create test collection with URL field
-        self.db.create_collection("leads", {
-            "id": "INTEGER PRIMARY KEY",
-            "email": "TEXT NOT NULL",
-            "name": "TEXT",
-            "url": "TEXT"
-        })
-
-        # Insert test data with URL
-        data = {
-            "email": "test@example.com",
-            "name": "Test User",
-            "url": "https://example.com/profile"
-        }
-        self.db.insert("leads", data)
-
-        # Retrieve and verify
-        result = self.db.get("leads", {"email": "test@example.com"})
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]["email"], "test@example.com")
-        self.assertEqual(result[0]["name"], "Test User")
-        self.assertEqual(result[0]["url"], "https://example.com/profile")
-
-    def test_lead_status_default_and_mandatory(self):
-        """Test that lead status defaults to 'new' and is mandatory in database"""
-        # Create test collection with status field
-        self.db.create_collection("leads", {
-            "id": "INTEGER PRIMARY KEY",
-            "email": "TEXT NOT NULL",
-            "name": "TEXT",
-            "status": "TEXT NOT NULL DEFAULT 'new'"
-        })
-
-        # Insert test data without status (should default to 'new')
-        data = {
-            "email": "test@example.com",
-            "name": "Test User"
-        }
-        self.db.insert("leads", data)
-
-        # Retrieve and verify status defaulted to 'new'
-        result = self.db.get("leads", {"email": "test@example.com"})
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]["status"], "new")
-
-        # Test that status cannot be set to NULL
-        with self.assertRaises(sqlite3.IntegrityError):
-            self.db.update("leads", {"status": None}, {"email": "test@example.com"})
-
-    def test_action_timestamp(self):
-        """Test that actions have a timestamp field in database"""
-        # Create test collection for actions
-        self.db.create_collection("actions", {
-            "id": "INTEGER PRIMARY KEY",
-            "lead_id": "INTEGER NOT NULL",
-            "action_type": "TEXT NOT NULL",
-            "details": "TEXT",
-            "timestamp": "TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP"
-        })
-
-        # Insert test action
-        data = {
-            "lead_id": 1,
-            "action_type": "email",
-            "details": "Initial contact"
-        }
-        self.db.insert("actions", data)
-
-        # Retrieve and verify timestamp
-        result = self.db.get("actions", {"lead_id": 1})
-        self.assertEqual(len(result), 1)
-        self.assertIn("timestamp", result[0])
-        self.assertIsNotNone(result[0]["timestamp"])
-
-    def test_process_followup_datetime(self):
-        """Test that process followup datetime is set to 7 days after last action in database"""
-        # Create test collections
-        self.db.create_collection("actions", {
-            "id": "INTEGER PRIMARY KEY",
-            "lead_id": "INTEGER NOT NULL",
-            "action_type": "TEXT NOT NULL",
-            "details": "TEXT",
-            "timestamp": "TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP"
-        })
-
-        self.db.create_collection("processes", {
-            "id": "INTEGER PRIMARY KEY",
-            "lead_id": "INTEGER NOT NULL",
-            "channel": "TEXT NOT NULL",
-            "last_action_id": "INTEGER NOT NULL",
-            "next_followup_datetime": "TEXT NOT NULL",
-            "status": "TEXT NOT NULL DEFAULT 'active'"
-        })
-
+        db.close()
+
+def test_connection_pool(db, db_path, caplog):
+    """Test that Databases on the same path share a connection until the last one closes"""
+    first, second = Database(db_path), Database(db_path)
+    conn = first.get_connection()
+    assert second.get_connection() is conn
+    first.close()
+    # Still open for the remaining Database
+    second.execute_query("SELECT 1")
+    second.close()
+    reopened = Database(db_path)
+    try:
+        assert reopened.get_connection() is not conn
+    finally:
+        reopened.close()
+    # Reopening the path with other pragmas keeps the open connection's, with a warning
+    with caplog.at_level(logging.WARNING, logger="crm.database"):
+        first = Database(db_path, TEST_PRAGMAS)
+        second = Database(db_path, TEST_PRAGMAS)
+        assert not caplog.records
+        third = Database(db_path)
+    assert "already open" in caplog.text
+    assert third.execute_query("PRAGMA synchronous")[0]["synchronous"] == 0
+    for database in (first, second, third):
+        database.close()
+    # In-memory databases are private to each Database
+    memory_db = Database(":memory:")
+    assert memory_db.get_connection() is not db.get_connection()
+    memory_db.close()
+
+def test_pragma_optimize_on_close():
+    """Test that closing the last Database on a connection runs PRAGMA optimize"""
+    db = Database(":memory:")
+    statements = []
+    db.get_connection().set_trace_callback(statements.append)
+    db.close()
+    assert "PRAGMA optimize" in statements
+
+def test_close_read_only_database(db_path):
+    """Test that a read-only database closes even though PRAGMA optimize cannot write"""
+    writer = Database(db_path)
+    writer.create_collection("leads", {"id": "INTEGER PRIMARY KEY", "email": "TEXT"})
+    writer.create_index("leads", ["email"])
+    writer.close()
+    db = Database(f"file:{db_path}?mode=ro")
+    db.get("leads", {"email": "test@example.com"})
+    conn = db.get_connection()
+    db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+def test_close_is_idempotent():
+    """Test that closing an already closed database is a no-op"""
+    db = Database(":memory:")
+    db.close()
+    db.close()
+
+LEAD = {"email": "test@example.com", "name": "Test User"}
+
+@pytest.mark.parametrize("data, change, expected", [
+    pytest.param(LEAD, None,
+                 [{"email": "test@example.com", "name": "Test User", "url": None}],
+                 id="insert_and_get"),
+    pytest.param({**LEAD, "url": "https://example.com/profile"}, None,
+                 [{"email": "test@example.com", "name": "Test User", "url": "https://example.com/profile"}],
+                 id="lead_with_url"),
+    pytest.param(LEAD, lambda db: db.update("leads", {"name": "Updated Name"}, {"email": "test@example.com"}),
+                 [{"email": "test@example.com", "name": "Updated Name", "url": None}],
+                 id="update"),
+    pytest.param(LEAD, lambda db: db.delete("leads", {"email": "test@example.com"}), [],
+                 id="delete"),
+])
+def test_crud(db, data, change, expected):
+    """Test inserting a lead, optionally changing it, and reading it back"""
+    db.insert("leads", data)
+    if change is not None:
+        change(db)
+    result = db.get("leads", {"email": "test@example.com"}, columns=["email", "name", "url"])
+    assert result == expected
+
+def test_insert_returning(db):
+    """Test inserting a record and reading back generated columns"""
+    row = db.insert_returning("actions", {"lead_id": 1}, ["id", "timestamp"])
+    stored = db.get("actions", {"lead_id": 1})[0]
+    assert row == {"id": stored["id"], "timestamp": stored["timestamp"]}
+
+def test_insert_many_returning(db):
+    """Test inserting several records in one statement and getting the stored rows back"""
+    rows = db.insert_many_returning("leads", [
+        {"email": "test1@example.com"},
+        {"email": "test2@example.com"}
+    ], ["id", "email", "status"])
+    assert [row["email"] for row in rows] == ["test1@example.com", "test2@example.com"]
+    assert [row["status"] for row in rows] == ["new", "new"]
+    assert rows[0]["id"] < rows[1]["id"]
+    assert db.insert_many_returning("leads", [], ["id"]) == []
+
+def test_upsert(db):
+    """Test that upsert inserts once and then updates the conflicting row"""
+    first_id = db.upsert("processes", {"lead_id": 1, "channel": "email", "status": "active"}, ["lead_id"])
+    second_id = db.upsert("processes", {"lead_id": 1, "channel": "phone", "status": "closed"},
+                          ["lead_id"], ["channel"])
+    assert first_id == second_id
+
+    result = db.get("processes", {"lead_id": 1})
+    assert len(result) == 1
+    # Only the listed update column changes on conflict
+    assert result[0]["channel"] == "phone"
+    assert result[0]["status"] == "active"
+
+    # upsert_returning hands back the stored row instead of just its id
+    row = db.upsert_returning("processes", {"lead_id": 1, "channel": "sms", "status": "closed"},
+                              ["lead_id"], ["id", "channel", "status"])
+    assert row == {"id": first_id, "channel": "sms", "status": "closed"}
+
+def test_transaction(db):
+    """Test that transactions commit together and roll back on error"""
+    with db.transaction():
+        db.insert("leads", {"email": "test1@example.com"})
+        db.insert("leads", {"email": "test2@example.com"})
+    assert len(db.get("leads")) == 2
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction():
+            db.insert("leads", {"email": "test3@example.com"})
+            db.insert("leads", {"email": None})
+    assert len(db.get("leads")) == 2
+
+    # A failing nested transaction only undoes its own statements
+    with db.transaction():
+        db.insert("leads", {"email": "test4@example.com"})
+        with pytest.raises(sqlite3.IntegrityError):
+            with db.transaction():
+                db.insert("leads", {"email": "test5@example.com"})
+                db.insert("leads", {"email": None})
+    emails = [row["email"] for row in db.get("leads", order_by="id")]
+    assert emails == ["test1@example.com", "test2@example.com", "test4@example.com"]
+
+def test_update_returning(db):
+    """Test updating a record and reading back the updated row"""
+    lead_id = db.insert("leads", {"email": "test@example.com", "name": "Test User"})
+
+    row = db.update_returning("leads", {"name": "Updated Name"}, {"id": lead_id})
+    assert row == {"id": lead_id, "email": "test@example.com", "name": "Updated Name",
+                   "status": "new", "url": None, "score": None}
+    row = db.update_returning("leads", {"name": "Updated Again"}, {"id": lead_id}, ["name"])
+    assert row == {"name": "Updated Again"}
+    assert db.update_returning("leads", {"name": "Nobody"}, {"id": lead_id + 1}) is None
+
+def test_filter_query(db):
+    """Test filtering records with complex conditions"""
+    # Insert test data
+    test_data = [
+        {"email": "test1@example.com", "status": "new", "score": 80},
+        {"email": "test2@example.com", "status": "contacted", "score": 60},
+        {"email": "test3@example.com", "status": "new", "score": 90}
+    ]
+    db.insert_many("leads", test_data)
+
+    # Test complex filter
+    result = db.get("leads", 
+                    {"status": "new", "score": (">", 85)},
+                    order_by="score DESC")
+    
+    assert len(result) == 1
+    assert result[0]["email"] == "test3@example.com"
+
+def test_get_selected_columns(db):
+    """Test retrieving only the requested columns"""
+    db.insert("leads", {"email": "test@example.com", "name": "Test User", "score": 80})
+
+    result = db.get("leads", {"email": "test@example.com"}, columns=["email", "name"])
+    assert result == [{"email": "test@example.com", "name": "Test User"}]
+    result = db.search("leads", {"score": 80}, columns=["id"])
+    assert list(result[0]) == ["id"]
+
+def test_insert_many_and_in_filter(db):
+    """Test inserting several records at once and filtering with IN"""
+    db.insert_many("leads", [
+        {"email": "test1@example.com", "status": "new"},
+        {"email": "test2@example.com", "status": "contacted"},
+        {"email": "test3@example.com", "status": "new"}
+    ])
+
+    result = db.get("leads", {"email": ("IN", ["test1@example.com", "test3@example.com"])},
+                    order_by="id")
+    assert [row["email"] for row in result] == ["test1@example.com", "test3@example.com"]
+
+    # Rows with different column sets are inserted in the same call
+    db.insert_many("leads", [
+        {"email": "test4@example.com"},
+        {"email": "test5@example.com", "status": "contacted"}
+    ])
+    result = db.get("leads", {"email": ("IN", ["test4@example.com", "test5@example.com"])},
+                    order_by="id")
+    assert [row["status"] for row in result] == ["new", "contacted"]
+    assert db.delete("leads", {"email": "test4@example.com"}) == 1
+    assert db.delete("leads", {"email": "test5@example.com"}) == 1
+
+    # A failing row rolls back the whole batch
+    with pytest.raises(sqlite3.IntegrityError):
+        db.insert_many("leads", [
+            {"email": "test4@example.com", "status": "new"},
+            {"email": None, "status": "new"}
+        ])
+    assert len(db.get("leads")) == 3
+
+def test_lead_status_default_and_mandatory(db):
+    """Test that lead status defaults to 'new' and is mandatory in database"""
+    # Insert test data without status (should default to 'new')
+    data = {
+        "email": "test@example.com",
+        "name": "Test User"
+    }
+    db.insert("leads", data)
+
+    # Retrieve and verify status defaulted to 'new'
+    result = db.get("leads", {"email": "test@example.com"})
+    assert [(row["email"], row["name"], row["status"]) for row in result] == [
+        ("test@example.com", "Test User", "new")]
+
+    # Test that status cannot be set to NULL
+    with pytest.raises(sqlite3.IntegrityError):
+        db.update("leads", {"status": None}, {"email": "test@example.com"})
+
+def test_action_timestamp(db):
+    """Test that actions have a timestamp field in database"""
+    # Insert test action
+    data = {
+        "lead_id": 1,
+        "action_type": "email",
+        "details": "Initial contact"
+    }
+    db.insert("actions", data)
+
+    # Retrieve and verify timestamp
+    result = db.get("actions", {"lead_id": 1})
+    assert len(result) == 1
+    assert "timestamp" in result[0]
+    assert result[0]["timestamp"] is not None
+
+def test_process_followup_datetime(db):
+    """Test that process followup datetime is set to 7 days after last action in database"""
+    # Set up in one transaction (a single commit)
+    with db.transaction():
         # Insert test action
         action_data = {
             "lead_id": 1,
             "action_type": "email",
             "details": "Initial contact"
         }
-        action_id = self.db.insert("actions", action_data)
+        action_id = db.insert("actions", action_data)
 
         # Get the action's timestamp
-        action = self.db.get("actions", {"id": action_id})[0]
+        action = db.get("actions", {"id": action_id})[0]
         action_timestamp = action["timestamp"]
 
         # Calculate expected followup datetime (7 days after action timestamp)
-        from datetime import datetime, timedelta
-        expected_followup = datetime.strptime(action_timestamp, "%Y-%m-%d %H:%M:%S") + timedelta(days=7)
-        expected_followup_str = expected_followup.strftime("%Y-%m-%d %H:%M:%S")
+        expected_followup = datetime.strptime(action_timestamp, _TS_FMT) + timedelta(days=7)
+        expected_followup_str = expected_followup.strftime(_TS_FMT)
 
         # Insert process with followup datetime
         process_data = {
@@ -285,13 +388,81 @@ class TestDatabase(unittest.TestCase):
             "next_followup_datetime": expected_followup_str,
             "status": "active"
         }
-        process_id = self.db.insert("processes", process_data)
+        process_id = db.insert("processes", process_data)
+
+    # Retrieve and verify followup datetime
+    result = db.get("processes", {"id": process_id})
+    assert [(row["last_action_id"], datetime.strptime(row["next_followup_datetime"], _TS_FMT))
+            for row in result] == [(action_id, expected_followup)]
+
+# Tests that create or alter tables run on schema_db instead of the shared tables
+def test_create_collection(schema_db):
+    """Test creating a new collection (table)"""
+    collection_name = "leads"
+    columns = {
+        "id": "INTEGER PRIMARY KEY",
+        "email": "TEXT NOT NULL",
+        "name": "TEXT",
+        "status": "TEXT DEFAULT 'new'"
+    }
+    schema_db.create_collection(collection_name, columns)
+    
+    # Verify collection exists
+    result = schema_db.execute_query(_TABLE_EXISTS, (collection_name,))
+    assert len(result) == 1
+    assert result[0]['name'] == collection_name
+
+def test_create_index(schema_db):
+    """Test creating a unique index on a collection"""
+    schema_db.create_collection("leads", {
+        "id": "INTEGER PRIMARY KEY",
+        "email": "TEXT NOT NULL"
+    })
+    schema_db.create_index("leads", ["email"], unique=True)
+
+    result = schema_db.execute_query("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='leads'")
+    assert [row["name"] for row in result] == ["idx_leads_email"]
+
+    # The unique index rejects a second row with the same email
+    schema_db.insert("leads", {"email": "test@example.com"})
+    with pytest.raises(sqlite3.IntegrityError):
+        schema_db.insert("leads", {"email": "test@example.com"})
+
+def test_add_column(schema_db):
+    """Test adding a new column to an existing collection (single connection version)"""
+    conn = schema_db.get_connection()
+    cursor = conn.cursor()
+    # The schema changes and the dummy row are committed together
+    with schema_db.transaction():
+        # Drop the table if it exists to ensure a fresh schema
+        cursor.execute("DROP TABLE IF EXISTS leads")
+        # Create initial collection
+        cursor.execute("CREATE TABLE leads (id INTEGER PRIMARY KEY, email TEXT NOT NULL)")
 
-        # Retrieve and verify followup datetime
-        result = self.db.get("processes", {"id": process_id})
-        self.assertEqual(len(result), 1)
-        actual_followup = datetime.strptime(result[0]["next_followup_datetime"], "%Y-%m-%d %H:%M:%S")
-        self.assertEqual(actual_followup, expected_followup)
+        # Check if table exists
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        assert ("leads",) in cursor.fetchall()
+
+        # Insert a dummy row to force schema flush
+        cursor.execute("INSERT INTO leads (email) VALUES (?)", ("dummy@example.com",))
+
+        # Add new column
+        cursor.execute("ALTER TABLE leads ADD COLUMN status TEXT DEFAULT 'new'")
 
-if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+    # Verify column was added
+    cursor.execute("PRAGMA table_info(leads)")
+    result = cursor.fetchall()
+    columns = [row[1] for row in result]
+    assert "status" in columns
+
+def test_add_column_through_database(schema_db):
+    """Test that a column added by Database.add_column is usable straight away"""
+    schema_db.create_collection("leads", {
+        "id": "INTEGER PRIMARY KEY",
+        "email": "TEXT NOT NULL"
+    })
+    schema_db.insert("leads", {"email": "test@example.com"})
+    schema_db.add_column("leads", "status", "TEXT DEFAULT 'new'")
+
+    result = schema_db.get("leads", {"email": "test@example.com"})
+    assert result[0]["status"] == "new"